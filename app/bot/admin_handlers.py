@@ -9,7 +9,9 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.date import DateTrigger
 
 from app.bot.admin_keyboards import get_main_keyboard
+from app.bot.broadcast import AUDIENCE_ALL
 from app.bot.jobs import notify_users
+from app.bot.rate_limiter import TelegramRateLimiter
 from app.services.db_service import DbService
 from app.services.redis_service import RedisService
 
@@ -40,9 +42,7 @@ async def handle_notification_button(callback: types.CallbackQuery, state: State
 
 
 @admin_router.message(NotificationDataRequest.waiting_for_data)
-async def create_notification_task(
-    message: types.Message, state: State, scheduler: AsyncIOScheduler, db_service: DbService
-) -> None:
+async def create_notification_task(message: types.Message, state: State, scheduler: AsyncIOScheduler) -> None:
     await state.clear()
     data = message.caption if message.caption else message.text
     spl = data.split("#")
@@ -53,10 +53,9 @@ async def create_notification_task(
     text, date = spl[0].strip(), spl[1].strip()
     spl_date = date.split(":")
     photo_id = message.photo[-1].file_id if message.photo else None
-    user_ids = await db_service.get_users_ids()
     scheduler.add_job(
         notify_users,
-        args=(text, user_ids, photo_id),
+        args=(text, AUDIENCE_ALL, photo_id),
         misfire_grace_time=300,
         trigger=DateTrigger(
             run_date=datetime(
@@ -93,3 +92,9 @@ async def deleted_stats(callback: types.CallbackQuery, db_service: DbService) ->
     ans = await db_service.deleted_stats()
     await callback.message.answer(ans)
     await callback.answer()
+
+
+@admin_router.callback_query(F.data == "telegram_stats")
+async def telegram_stats(callback: types.CallbackQuery, telegram_limiter: TelegramRateLimiter) -> None:
+    await callback.message.answer(telegram_limiter.format_stats())
+    await callback.answer()
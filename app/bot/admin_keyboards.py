@@ -15,6 +15,9 @@ def get_main_keyboard() -> InlineKeyboardMarkup:
             ],
             [
                 InlineKeyboardButton(text="Статистика ушедших пользователей", callback_data="deleted_stats")
+            ],
+            [
+                InlineKeyboardButton(text="📈 Статистика запросов к Telegram", callback_data="telegram_stats")
             ]
         ]
     )
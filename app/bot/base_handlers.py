@@ -27,11 +27,17 @@ from app.bot.base_keyboards import (
 )
 from app.bot.constants import Constants
 from app.bot.msgs_text import AVAILABLE_FILTERS, MsgsText
-from app.bot.utils import delete_user_message, generate_place_text, show_place, update_or_send_message
+from app.bot.utils import (
+    delete_user_message,
+    generate_place_text,
+    get_place_text,
+    show_place,
+    update_or_send_message,
+)
 from app.core.settings import Settings
 from app.services.coordinator import Coordinator
 from app.services.db_service import DbService
-from app.services.redis_service import RedisService
+from app.services.redis_service import FEED_EMPTY, FEED_END, FEED_START, RedisService
 
 logger = logging.getLogger(__name__)
 base_router = Router()
@@ -54,19 +60,18 @@ async def process_place_bad(callback_query: types.CallbackQuery, redis_service:
     user_id = callback_query.from_user.id
 
     user = await db_service.get_user(user_id)
-    user_data = await redis_service.get_user_data(user_id)
+    user_data = await redis_service.get_user_data(
+        user_id, "selected_categories", "selected_wishes", "current_place_index"
+    )
     user_categories = user_data.get("selected_categories", [])
     user_wishes = user_data.get("selected_wishes", [])
     user_filters = user["filters"] if user else []
-    places = user_data.get("places", [])
-    index = user_data.get("current_place_index", 0)
+    place = await db_service.get_feed_place(user_id, user_data.get("current_place_index", 0))
 
-    if not places or index >= len(places):
+    if not place:
         await callback_query.answer("Ошибка: не удалось найти место для отправки.", show_alert=True)
         return
 
-    place = places[index]
-
     # Формируем текст с рейтингом и получаем ID места для возможности удаления
     rating = place.get("rating")
     rating_text = f"⭐ {rating}/5" if rating else "⭐ Рейтинг не указан"
@@ -124,7 +129,7 @@ async def process_place_bad(callback_query: types.CallbackQuery, redis_service:
         await callback_query.bot.send_message(chat_id=Settings.MODERATORS_CHAT_ID, text=place_text, parse_mode="HTML")
 
     # Помечаем место как просмотренное
-    await db_service.mark_place_as_viewed(user_id, place.get("name"))
+    await db_service.mark_place_as_viewed(user_id, place_id)
 
 
 @base_router.callback_query(F.data.startswith("mod_chat_del"))
@@ -388,16 +393,7 @@ async def handle_liked_selection(
 
     place = places[place_index]
 
-    # Формируем текст с рейтингом
-    rating = place.get("rating")
-    rating_text = f"⭐ {rating}/5" if rating else "⭐ Рейтинг не указан"
-
-    # Получаем категории и пожелания места из базы данных и ормируем текст с категориями и пожеланиями
-    categories_text, wishes_text, website = await db_service.get_categories_and_wishes(place)
-
-    distance_text = ""
-
-    place_text = generate_place_text(place, website, rating_text, distance_text)
+    place_text = await get_place_text(place, "", db_service)
 
     # Получаем ссылку на фото и проверяем ее валидность
     photo_url = place.get("photo")
@@ -451,16 +447,7 @@ async def handle_disliked_selection(
 
     place = places[place_index]
 
-    # Формируем текст с рейтингом
-    rating = place.get("rating")
-    rating_text = f"⭐ {rating}/5" if rating else "⭐ Рейтинг не указан"
-
-    # Получаем категории и пожелания места из базы данных и ормируем текст с категориями и пожеланиями
-    categories_text, wishes_text, website = await db_service.get_categories_and_wishes(place)
-
-    distance_text = ""
-
-    place_text = generate_place_text(place, website, rating_text, distance_text)
+    place_text = await get_place_text(place, "", db_service)
 
     # Получаем ссылку на фото и проверяем ее валидность
     photo_url = place.get("photo")
@@ -574,7 +561,7 @@ async def reset_all_categories(
     user_id = callback.from_user.id
 
     # Сбрасываем все категории
-    if f"data:{user_id}" in await redis_service.get_keys("data:*"):
+    if await redis_service.user_data_exists(user_id):
         await redis_service.set_user_data_params(user_id, {"selected_categories": []})
 
     # Обновляем сообщение
@@ -605,7 +592,7 @@ async def reset_all_wishes(callback: types.CallbackQuery, redis_service: RedisSe
     user_id = callback.from_user.id
 
     # Сбрасываем все пожелания
-    if f"data:{user_id}" in await redis_service.get_keys("data:*"):
+    if await redis_service.user_data_exists(user_id):
         await redis_service.set_user_data_params(user_id, {"selected_wishes": []})
 
     # Обновляем сообщение
@@ -733,7 +720,7 @@ async def show_places_main(callback: types.CallbackQuery, db_service: DbService,
     user = await db_service.get_user(user_id)
 
     # Проверяем, есть ли непросмотренные места
-    places = await db_service.get_places_for_user(user_id, limit=400, offset=0, sort_by_distance=False)
+    places = await db_service.get_places_for_user(user_id, limit=400, offset=0)
 
     if not places:
         # Все места просмотрены
@@ -778,11 +765,9 @@ async def show_places_main(callback: types.CallbackQuery, db_service: DbService,
             )
     else:
         # Если нет геолокации, показываем обычные рекомендации
-        await redis_service.set_user_data_params(user_id, {"current_place_index": 0})
-        await redis_service.set_user_data_params(user_id, {"current_offset": 0})
-
         # Сохраняем места для пользователя
-        await redis_service.set_user_data_params(user_id, {"places": places})
+        await db_service.save_user_feed(user_id, places)
+        await redis_service.set_user_data_params(user_id, {"current_place_index": 0, "current_offset": 0})
 
         # Показываем первое место
         await show_place(user_id, callback.message.chat.id, 0, bot, db_service, redis_service)
@@ -798,11 +783,9 @@ async def view_nearby_places(
     callback: types.CallbackQuery, redis_service: RedisService, db_service: DbService, bot: Bot
 ):
     user_id = callback.from_user.id
-    await redis_service.set_user_data_params(user_id, {"current_place_index": 0})
-    await redis_service.set_user_data_params(user_id, {"current_offset": 0})
 
-    # Получаем места с сортировкой по расстоянию
-    places = await db_service.get_places_for_user(user_id, limit=400, offset=0, sort_by_distance=True)
+    # Получаем ближайшие места всего каталога
+    places = await db_service.get_nearby_places_for_user(user_id, limit=400)
 
     if not places:
         # Обработка случая, когда нет мест
@@ -825,7 +808,8 @@ async def view_nearby_places(
         return
 
     # Сохраняем места для пользователя
-    await redis_service.set_user_data_params(user_id, {"places": places})
+    await db_service.save_user_feed(user_id, places)
+    await redis_service.set_user_data_params(user_id, {"current_place_index": 0, "current_offset": 0})
 
     # Показываем первое место
     await show_place(user_id, callback.message.chat.id, 0, bot, db_service, redis_service)
@@ -838,11 +822,9 @@ async def view_recommended_places(
     callback: types.CallbackQuery, redis_service: RedisService, db_service: DbService, bot: Bot
 ):
     user_id = callback.from_user.id
-    await redis_service.set_user_data_params(user_id, {"current_place_index": 0})
-    await redis_service.set_user_data_params(user_id, {"current_offset": 0})
 
     # Получаем места без сортировки по расстоянию
-    places = await db_service.get_places_for_user(user_id, limit=400, offset=0, sort_by_distance=False)
+    places = await db_service.get_places_for_user(user_id, limit=400, offset=0)
 
     if not places:
         # Обработка случая, когда нет мест
@@ -865,7 +847,8 @@ async def view_recommended_places(
         return
 
     # Сохраняем места для пользователя
-    await redis_service.set_user_data_params(user_id, {"places": places})
+    await db_service.save_user_feed(user_id, places)
+    await redis_service.set_user_data_params(user_id, {"current_place_index": 0, "current_offset": 0})
 
     # Показываем первое место
     await show_place(user_id, callback.message.chat.id, 0, bot, db_service, redis_service)
@@ -1326,15 +1309,14 @@ async def handle_category_selection(
     user_id = callback.from_user.id
     category = callback.data
 
-    if f"data:{user_id}" not in await redis_service.get_keys("data:*"):
-        await redis_service.set_user_data(user_id, {"selected_categories": [], "selected_wishes": []})
-
-    user_data = await redis_service.get_user_data(user_id)
-    if category in user_data["selected_categories"]:
-        user_data["selected_categories"].remove(category)
+    selected_categories = (await redis_service.get_user_data(user_id, "selected_categories")).get(
+        "selected_categories", []
+    )
+    if category in selected_categories:
+        selected_categories.remove(category)
     else:
-        user_data["selected_categories"].append(category)
-    await redis_service.set_user_data(user_id, user_data)
+        selected_categories.append(category)
+    await redis_service.set_user_data_params(user_id, {"selected_categories": selected_categories})
 
     # Обновляем сообщение с новым состоянием кнопок
 
@@ -1392,17 +1374,14 @@ async def handle_wish_selection(
     user_id = callback.from_user.id
     wish = callback.data
 
-    if f"data:{user_id}" not in await redis_service.get_keys("data:*"):
-        await redis_service.set_user_data(user_id, {"selected_categories": [], "selected_wishes": []})
+    selected_wishes = (await redis_service.get_user_data(user_id, "selected_wishes")).get("selected_wishes", [])
 
-    user_data = await redis_service.get_user_data(user_id)
-
-    if wish in user_data["selected_wishes"]:
-        user_data["selected_wishes"].remove(wish)
+    if wish in selected_wishes:
+        selected_wishes.remove(wish)
     else:
-        user_data["selected_wishes"].append(wish)
+        selected_wishes.append(wish)
 
-    await redis_service.set_user_data(user_id, user_data)
+    await redis_service.set_user_data_params(user_id, {"selected_wishes": selected_wishes})
 
     # Обновляем сообщение
 
@@ -1436,9 +1415,11 @@ async def confirm_wishes(
 ):
     user_id = callback.from_user.id
 
-    user_data = await redis_service.get_user_data(user_id)
-    categories_count = len(user_data["selected_categories"])
-    wishes_count = len(user_data["selected_wishes"])
+    user_data = await redis_service.get_user_data(user_id, "selected_categories", "selected_wishes")
+    selected_categories = user_data.get("selected_categories", [])
+    selected_wishes = user_data.get("selected_wishes", [])
+    categories_count = len(selected_categories)
+    wishes_count = len(selected_wishes)
 
     # Показываем сообщение о процессе подбора
 
@@ -1455,8 +1436,8 @@ async def confirm_wishes(
     # Сохраняем пользователя в базу данных с сохранением геопозиции
     await db_service.create_or_update_user(
         user_id=user_id,
-        categories=user_data["selected_categories"],
-        wishes=user_data["selected_wishes"],
+        categories=selected_categories,
+        wishes=selected_wishes,
         filters=user["filters"] if user else [],  # Сохраняем текущие фильтры
         latitude=user["latitude"] if user else None,  # Сохраняем геопозицию
         longitude=user["longitude"] if user else None,  # Сохраняем геопозицию
@@ -1524,46 +1505,37 @@ async def back_to_main_menu(
 @base_router.callback_query(F.data.in_(["place_prev", "place_next"]))
 async def navigate_places(callback: types.CallbackQuery, redis_service: RedisService, db_service: DbService, bot: Bot):
     user_id = callback.from_user.id
-    user_data = await redis_service.get_user_data(user_id)
-    current_index = user_data.get("current_place_index", 0)
-    places = user_data.get("places", [])
+    step = -1 if callback.data == "place_prev" else 1
+    status, current_index, place = await db_service.move_feed_cursor(user_id, step)
 
-    if not places:
+    if status == FEED_EMPTY:
         await callback.answer("Нет мест для показа")
         return
 
-    if callback.data == "place_prev":
-        if current_index > 0:
-            current_index -= 1
-        else:
-            await callback.answer("Это первое место")
-            return
-    else:  # place_next
-        if current_index < len(places) - 1:
-            current_index += 1
-        else:
-            # Все места просмотрены - показываем сообщение/меню
-
-            keyboard = get_update_keyboard()
-            try:
-                await callback.message.edit_text(text=MsgsText.ALL_VIEWED.value, reply_markup=keyboard)
-            except Exception as e:
-                logger.error(f"Error editing message: {e}")
-                chat_id = callback.message.chat.id
-                await update_or_send_message(
-                    chat_id=chat_id,
-                    text=MsgsText.ALL_VIEWED.value,
-                    bot=bot,
-                    redis_service=redis_service,
-                    reply_markup=keyboard,
-                )
-            await callback.answer()
-            return
+    if status == FEED_START:
+        await callback.answer("Это первое место")
+        return
 
-    await redis_service.set_user_data_params(user_id, {"current_place_index": current_index})
+    if status == FEED_END:
+        # Все места просмотрены - показываем сообщение/меню
+        keyboard = get_update_keyboard()
+        try:
+            await callback.message.edit_text(text=MsgsText.ALL_VIEWED.value, reply_markup=keyboard)
+        except Exception as e:
+            logger.error(f"Error editing message: {e}")
+            chat_id = callback.message.chat.id
+            await update_or_send_message(
+                chat_id=chat_id,
+                text=MsgsText.ALL_VIEWED.value,
+                bot=bot,
+                redis_service=redis_service,
+                reply_markup=keyboard,
+            )
+        await callback.answer()
+        return
 
     # Показываем место
-    await show_place(user_id, callback.message.chat.id, current_index, bot, db_service, redis_service)
+    await show_place(user_id, callback.message.chat.id, current_index, bot, db_service, redis_service, place)
 
     await callback.answer()
 
@@ -206,7 +206,8 @@ def get_reset_geolocation_keyboard() -> InlineKeyboardMarkup:
 
 
 async def get_categories_keyboard(user_id: int, redis_service: RedisService) -> InlineKeyboardMarkup:
-    selected_categories = (await redis_service.get_user_data(user_id)).get("selected_categories", [])
+    user_data = await redis_service.get_user_data(user_id, "selected_categories")
+    selected_categories = user_data.get("selected_categories", [])
     buttons = []
 
     categories = [(category_type, category_type) for category_type in MsgsText.CATEGORIES_TYPES.value]
@@ -225,7 +226,7 @@ async def get_categories_keyboard(user_id: int, redis_service: RedisService) ->
 
 
 async def get_wishes_keyboard(user_id: int, redis_service: RedisService) -> InlineKeyboardMarkup:
-    selected_wishes = (await redis_service.get_user_data(user_id)).get("selected_wishes", [])
+    selected_wishes = (await redis_service.get_user_data(user_id, "selected_wishes")).get("selected_wishes", [])
     buttons = []
 
     wishes = [(wish_type, wish_type) for wish_type in MsgsText.WISHES_TYPES.value]
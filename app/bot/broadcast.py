@@ -0,0 +1,254 @@
+import asyncio
+import logging
+import time
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError
+
+from app.bot.admin_keyboards import get_menu_keyboard
+from app.bot.constants import Constants
+from app.bot.rate_limiter import bulk_sends
+from app.services.db_service import DbService
+from app.services.redis_service import BROADCAST_BLOCKED, BROADCAST_FAILED, BROADCAST_SENT, RedisService
+
+logger = logging.getLogger(__name__)
+
+# Вызывается после успешной отправки: (user_id, message_id)
+OnDelivered = Callable[[int, int], Awaitable[None]]
+
+# Описание получателей, которое хранится в задаче и в состоянии рассылки вместо списка id
+AUDIENCE_ALL = {"audience": "all"}
+
+
+class _Checkpoint:
+    """
+    Курсор рассылки по возрастающим id: всем получателям с id не больше value рассылка уже отправлялась.
+    """
+
+    def __init__(self, value: int) -> None:
+        self._last = value
+        # Отправляемые сейчас id в порядке возрастания
+        self._in_flight: dict[int, None] = {}
+
+    @property
+    def value(self) -> int:
+        if self._in_flight:
+            return next(iter(self._in_flight)) - 1
+        return self._last
+
+    def start(self, user_id: int) -> None:
+        self._in_flight[user_id] = None
+
+    def produced(self, user_id: int) -> None:
+        self._last = user_id
+
+    def finish(self, user_id: int) -> None:
+        self._in_flight.pop(user_id, None)
+
+
+class BroadcastEngine:
+    """
+    Рассылка сообщений пулом из workers отправителей. Получатели читаются из базы пачками по описанию выборки,
+    темп задаёт TelegramRateLimiter (запросы внутри bulk_sends). Курсор и итоги по получателям сохраняются в Redis,
+    поэтому прерванная рассылка продолжается с того же места. Заблокировавшие бота пользователи удаляются
+    из базы пачками в конце.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        db_service: DbService,
+        redis_service: RedisService,
+        workers: int = 8,
+        progress_interval: float = 10,
+        chunk_size: int = 1000,
+    ) -> None:
+        self._bot = bot
+        self._db_service = db_service
+        self._redis_service = redis_service
+        self._workers = workers
+        self._progress_interval = progress_interval
+        self._chunk_size = chunk_size
+        self._running: set[str] = set()
+
+    async def start(
+        self,
+        text: str,
+        audience: dict[str, Any],
+        photo_id: Optional[str] = None,
+        on_delivered: Optional[OnDelivered] = None,
+    ) -> None:
+        broadcast_id = uuid.uuid4().hex
+        total = await self._db_service.get_users_count()
+        data = {
+            "text": text,
+            "photo_id": photo_id,
+            "audience": audience,
+            "total": total,
+            "cursor": 0,
+            BROADCAST_SENT: 0,
+            BROADCAST_BLOCKED: 0,
+            BROADCAST_FAILED: 0,
+            "progress_msgs": {},
+        }
+        await self._redis_service.create_broadcast(broadcast_id, data)
+        logger.info(f"[Broadcast] {broadcast_id} created for {audience=}, about {total} users")
+        await self.run(broadcast_id, on_delivered)
+
+    async def resume_all(self, on_delivered: Optional[OnDelivered] = None) -> None:
+        """
+        Продолжает рассылки, прерванные остановкой бота.
+        """
+        for broadcast_id in await self._redis_service.get_active_broadcasts():
+            logger.info(f"[Broadcast] Resuming {broadcast_id}")
+            await self.run(broadcast_id, on_delivered)
+
+    async def run(self, broadcast_id: str, on_delivered: Optional[OnDelivered] = None) -> None:
+        if broadcast_id in self._running:
+            return
+        self._running.add(broadcast_id)
+        try:
+            await self._run(broadcast_id, on_delivered)
+        except Exception as e:
+            logger.error(f"Error while running broadcast {broadcast_id}: {e}")
+        finally:
+            self._running.discard(broadcast_id)
+
+    async def _run(self, broadcast_id: str, on_delivered: Optional[OnDelivered]) -> None:
+        state = await self._redis_service.get_broadcast(broadcast_id)
+        if not state:
+            await self._redis_service.finish_broadcast(broadcast_id)
+            return
+
+        done = await self._redis_service.get_broadcast_done(broadcast_id)
+        checkpoint = _Checkpoint(state.get("cursor", 0))
+        counters = {result: state.get(result, 0) for result in (BROADCAST_SENT, BROADCAST_BLOCKED, BROADCAST_FAILED)}
+
+        # Очередь ограничена, поэтому в памяти держится не больше пачки id, а не весь список получателей
+        queue: asyncio.Queue[Optional[int]] = asyncio.Queue(maxsize=self._workers * 2)
+
+        async def produce() -> None:
+            async for chunk in self._recipients(state["audience"], checkpoint.value):
+                for user_id in chunk:
+                    if user_id not in done:
+                        checkpoint.start(user_id)
+                        await queue.put(user_id)
+                    checkpoint.produced(user_id)
+            for _ in range(self._workers):
+                await queue.put(None)
+
+        async def worker() -> None:
+            while (user_id := await queue.get()) is not None:
+                result = await self._send(user_id, state["text"], state.get("photo_id"), on_delivered)
+                counters[result] += 1
+                try:
+                    await self._redis_service.record_broadcast_result(broadcast_id, user_id, result)
+                except Exception as e:
+                    logger.error(f"Error saving broadcast progress {broadcast_id} {user_id=}: {e}")
+                checkpoint.finish(user_id)
+
+        # Сообщения админам отправляются вне bulk_sends, чтобы не ждать в общей очереди рассылки
+        progress = asyncio.create_task(self._report_progress(broadcast_id, state, counters, checkpoint))
+        started = time.monotonic()
+        with bulk_sends():
+            workers = [asyncio.create_task(worker()) for _ in range(self._workers)]
+        workers.append(asyncio.create_task(produce()))
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            progress.cancel()
+
+        blocked = await self._redis_service.get_broadcast_blocked(broadcast_id)
+        if blocked:
+            await self._db_service.delete_users(blocked)
+        await self._redis_service.finish_broadcast(broadcast_id)
+
+        logger.info(
+            f"[Broadcast] {broadcast_id} finished in {time.monotonic() - started:.1f}s: "
+            f"{counters[BROADCAST_SENT]} sent, {len(blocked)} deleted, {counters[BROADCAST_FAILED]} failed"
+        )
+        await self._update_progress_msgs(
+            state,
+            (
+                f"Рассылка доставлена.\n{len(blocked)} пользователей заблокировали бота и были удалены из базы."
+                + (f"\nНе удалось отправить: {counters[BROADCAST_FAILED]}" if counters[BROADCAST_FAILED] else "")
+            ),
+        )
+
+    async def _send(self, user_id: int, text: str, photo_id: Optional[str], on_delivered: Optional[OnDelivered]) -> str:
+        try:
+            if photo_id:
+                sent_msg = await self._bot.send_photo(
+                    chat_id=user_id, photo=photo_id, caption=text, reply_markup=get_menu_keyboard()
+                )
+            else:
+                sent_msg = await self._bot.send_message(chat_id=user_id, text=text, reply_markup=get_menu_keyboard())
+        except TelegramForbiddenError as e:
+            logger.info(f"{e}")
+            return BROADCAST_BLOCKED
+        except Exception as e:
+            logger.error(f"Error sending notification to {user_id=}: {e}")
+            return BROADCAST_FAILED
+
+        if on_delivered is not None:
+            try:
+                await on_delivered(user_id, sent_msg.message_id)
+            except Exception as e:
+                logger.error(f"Error after sending notification to {user_id=}: {e}")
+        return BROADCAST_SENT
+
+    def _recipients(self, audience: dict[str, Any], after_id: int) -> AsyncIterator[list[int]]:
+        """
+        Пачки id получателей больше after_id по возрастанию для описания выборки audience.
+        """
+        if audience.get("audience") == "all":
+            return self._db_service.iter_users_ids(after_id, self._chunk_size)
+        raise ValueError(f"Unknown broadcast audience: {audience}")
+
+    async def _report_progress(
+        self, broadcast_id: str, state: dict[str, Any], counters: dict[str, int], checkpoint: _Checkpoint
+    ) -> None:
+        last_text = None
+        saved_cursor = checkpoint.value
+        while True:
+            cursor = checkpoint.value
+            if cursor != saved_cursor:
+                try:
+                    await self._redis_service.save_broadcast_cursor(broadcast_id, cursor)
+                    saved_cursor = cursor
+                except Exception as e:
+                    logger.error(f"Error saving broadcast cursor {broadcast_id}: {e}")
+
+            processed = sum(counters.values())
+            text = (
+                f"Рассылка: обработано {processed} из {state['total']}\n"
+                f"Отправлено: {counters[BROADCAST_SENT]}, заблокировали бота: {counters[BROADCAST_BLOCKED]}, "
+                f"ошибок: {counters[BROADCAST_FAILED]}"
+            )
+            if text != last_text:
+                await self._update_progress_msgs(state, text)
+                if not state.get("progress_saved"):
+                    # Id сообщений о ходе рассылки сохраняются, чтобы после перезапуска обновлять те же сообщения
+                    await self._redis_service.set_broadcast_params(
+                        broadcast_id, {"progress_msgs": state["progress_msgs"]}
+                    )
+                    state["progress_saved"] = True
+                last_text = text
+            await asyncio.sleep(self._progress_interval)
+
+    async def _update_progress_msgs(self, state: dict[str, Any], text: str) -> None:
+        progress_msgs = state["progress_msgs"]
+        for admin_id in Constants.ADMIN_IDS.value:
+            try:
+                msg_id = progress_msgs.get(str(admin_id))
+                if msg_id is not None:
+                    await self._bot.edit_message_text(text=text, chat_id=admin_id, message_id=msg_id)
+                else:
+                    msg = await self._bot.send_message(admin_id, text)
+                    progress_msgs[str(admin_id)] = msg.message_id
+            except Exception as e:
+                logger.error(f"Error while notifying admins: {e}")
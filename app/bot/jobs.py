@@ -1,14 +1,13 @@
+import asyncio
 import logging
-from datetime import datetime, timedelta
-from typing import Optional
+import time
+from datetime import timedelta
+from typing import Any, Optional, Union
 
-import pytz
-from aiogram.exceptions import TelegramForbiddenError
-from apscheduler.triggers.date import DateTrigger
-
-from app.bot.admin_keyboards import get_menu_keyboard
-from app.bot.constants import Constants
-from app.core.instances import bot, db_service, redis_service, scheduler
+from app.bot.broadcast import AUDIENCE_ALL
+from app.bot.rate_limiter import bulk_sends
+from app.core.instances import bot, broadcast_engine, db_service, redis_service
+from app.core.settings import Settings
 
 logger = logging.getLogger(__name__)
 
@@ -17,53 +16,63 @@ def reset_daily_count() -> None:
     redis_service.set_daily_count(0)
 
 
+async def refresh_place_catalog() -> None:
+    await db_service.refresh_place_catalog()
+
+
+async def flush_user_activity() -> None:
+    await db_service.flush_user_activity()
+
+
+async def flush_place_interactions() -> None:
+    await db_service.flush_place_interactions()
+
+
 async def notify_users(
     msg_text: str,
-    users_ids: list[int],
-    photo_id: Optional[int] = None,
+    audience: Union[dict[str, Any], list[int]],
+    photo_id: Optional[str] = None,
 ) -> None:
-    pass
-    del_count = 0
-    for user_id in users_ids:
-        try:
-            msg_id = None
-            if photo_id:
-                sent_msg = await bot.send_photo(
-                    chat_id=user_id, photo=photo_id, caption=msg_text, reply_markup=get_menu_keyboard()
-                )
-
-            else:
-                sent_msg = await bot.send_message(chat_id=user_id, text=msg_text, reply_markup=get_menu_keyboard())
-
-            msg_id = sent_msg.message_id
-            trigger_time = datetime.now(pytz.timezone("Europe/Moscow")) + timedelta(hours=12)
-            scheduler.add_job(
-                delete_notify_msg,
-                trigger=DateTrigger(run_date=trigger_time),
-                misfire_grace_time=300,
-                args=(user_id, msg_id),
-            )
-            logger.info(
-                f"Notification sent to {user_id=} and will be deleted at {trigger_time.strftime('%Y-%m-%d %H:%M:%S %Z')}"
-            )
-
-        except TelegramForbiddenError as e:
-            logger.info(f"{e}")
-            await db_service.delete_user(user_id)
-            del_count += 1
-        except Exception as e:
-            logger.error(f"Error sending notification: {e}")
+    if isinstance(audience, list):
+        # Задачи, созданные до хранения описания выборки, содержат список id всех пользователей
+        audience = AUDIENCE_ALL
+    await broadcast_engine.start(msg_text, audience, photo_id, on_delivered=schedule_notify_msg_deletion)
+
+
+async def resume_broadcasts() -> None:
+    await broadcast_engine.resume_all(on_delivered=schedule_notify_msg_deletion)
+
 
-    logger.info(f"All users notified. Deleted: {del_count=}")
+async def schedule_notify_msg_deletion(user_id: int, msg_id: int) -> None:
+    delete_at = time.time() + timedelta(hours=12).total_seconds()
+    await redis_service.schedule_msg_deletion(user_id, msg_id, delete_at)
+    logger.info(f"Notification sent to {user_id=} and will be deleted in 12 hours")
 
-    for admin_id in Constants.ADMIN_IDS.value:
+
+async def delete_due_messages() -> None:
+    """
+    Удаляет одну пачку сообщений из очереди отложенного удаления, время которых наступило.
+    """
+    due = await redis_service.pop_due_msg_deletions(time.time(), Settings.MSG_DELETE_BATCH_SIZE)
+    if not due:
+        return
+
+    async def delete(chat_id: int, msg_id: int) -> bool:
         try:
-            await bot.send_message(
-                admin_id, f"Рассылка доставлена.\n{del_count} пользователей заблокировали бота и были удалены из базы."
-            )
+            await bot.delete_message(chat_id=chat_id, message_id=msg_id)
+            return True
         except Exception as e:
-            logger.error(f"Error while notifying admins: {e}")
+            # Сообщение уже удалено пользователем, старше 48 часов или бот заблокирован — повторять незачем
+            logger.info(f"Could not delete message {msg_id} in {chat_id=}: {e}")
+            return False
+
+    with bulk_sends():
+        results = await asyncio.gather(*[delete(chat_id, msg_id) for chat_id, msg_id in due])
+    logger.info(f"[MsgDeletions] Deleted {sum(results)} of {len(due)} due messages")
 
 
 async def delete_notify_msg(chat_id: int, msg_id: int) -> None:
+    """
+    Остаётся для задач удаления, созданных в планировщике до появления очереди отложенного удаления.
+    """
     await bot.delete_message(chat_id=chat_id, message_id=msg_id)
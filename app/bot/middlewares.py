@@ -0,0 +1,25 @@
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from app.services.db_service import DbService
+
+
+class RequestScopeMiddleware(BaseMiddleware):
+    """
+    Общий кэш профилей пользователей на время обработки апдейта. Соединение с БД на весь апдейт
+    не одалживается: сервисы открывают session() только вокруг своих запросов к БД.
+    """
+
+    def __init__(self, db_service: DbService) -> None:
+        self._db_service = db_service
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        async with self._db_service.request_scope():
+            return await handler(event, data)
@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import GetUpdates, Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+logger = logging.getLogger(__name__)
+
+# Массовые отправки (рассылки) идут с более низким приоритетом, чем ответы пользователям
+_bulk: ContextVar[bool] = ContextVar("telegram_bulk", default=False)
+
+# Методы, создающие новые сообщения: только на них действует лимит сообщений в чат
+_SEND_METHODS = {"CopyMessage", "CopyMessages", "ForwardMessage", "ForwardMessages"}
+
+
+def _is_send(method: TelegramMethod) -> bool:
+    name = type(method).__name__
+    return name.startswith("Send") or name in _SEND_METHODS
+
+
+@contextmanager
+def bulk_sends() -> Iterator[None]:
+    """
+    Помечает запросы к Telegram внутри блока как массовые.
+    """
+    token = _bulk.set(True)
+    try:
+        yield
+    finally:
+        _bulk.reset(token)
+
+
+class TokenBucket:
+    """
+    Корзина токенов: rate токенов в секунду, не больше capacity подряд. Ожидающие обслуживаются по очереди,
+    но запросы с low_priority=True пропускают вперёд все ожидающие обычные запросы.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+        # Сколько обычных запросов ждёт токен; пока они есть, низкоприоритетные не встают в очередь
+        self._waiting = 0
+        self._no_waiting = asyncio.Event()
+        self._no_waiting.set()
+
+    @property
+    def idle(self) -> bool:
+        now = time.monotonic()
+        return not self._lock.locked() and now >= self._blocked_until and self._refill(now) >= self._capacity
+
+    def _refill(self, now: float) -> float:
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+        return self._tokens
+
+    def block(self, seconds: float) -> None:
+        """
+        Запрещает выдачу токенов на seconds секунд (после ответа Telegram с retry_after).
+        """
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+    async def acquire(self, low_priority: bool = False) -> float:
+        """
+        Забирает токен, при необходимости ожидая. Возвращает время ожидания в секундах.
+        Низкоприоритетный запрос, который уже ждёт токен под замком, опережает обычные не больше чем на один токен.
+        """
+        started = time.monotonic()
+        if low_priority:
+            while True:
+                await self._no_waiting.wait()
+                async with self._lock:
+                    # Пока ждали замок, в очередь мог встать обычный запрос — пропускаем его вперёд
+                    if self._waiting:
+                        continue
+                    return await self._take(started)
+
+        self._waiting += 1
+        self._no_waiting.clear()
+        try:
+            async with self._lock:
+                return await self._take(started)
+        finally:
+            self._waiting -= 1
+            if not self._waiting:
+                self._no_waiting.set()
+
+    async def _take(self, started: float) -> float:
+        while True:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                await asyncio.sleep(self._blocked_until - now)
+                continue
+            if self._refill(now) >= 1:
+                self._tokens -= 1
+                return time.monotonic() - started
+            await asyncio.sleep((1 - self._tokens) / self._rate)
+
+
+class _MethodStats:
+    __slots__ = ("calls", "total_latency", "max_latency", "throttled", "throttled_wait", "retry_after", "errors")
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.throttled = 0
+        self.throttled_wait = 0.0
+        self.retry_after = 0
+        self.errors = 0
+
+
+class TelegramRateLimiter(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: ограничивает исходящие запросы к чатам общей корзиной, а отправку новых сообщений —
+    ещё и корзиной на каждый чат (правка и удаление сообщений её не расходуют, листание карточек не тормозится).
+    Пережидает retry_after от Telegram и повторяет запрос, копит статистику по методам.
+    Массовые отправки (см. bulk_sends) дополнительно проходят через отдельную, более медленную корзину
+    и в общей корзине пропускают вперёд ожидающие ответы пользователям.
+    retry_after для запроса без чата или для разных чатов подряд считается общим для бота и останавливает
+    общую корзину, иначе — только корзину чата.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30,
+        bulk_rate: float = 20,
+        chat_rate: float = 1,
+        chat_burst: float = 3,
+        group_rate_per_minute: float = 20,
+        max_retries: int = 3,
+        max_chat_buckets: int = 10000,
+    ) -> None:
+        self._global = TokenBucket(global_rate, global_rate)
+        self._bulk = TokenBucket(bulk_rate, bulk_rate)
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._group_rate = group_rate_per_minute / 60
+        self._max_retries = max_retries
+        self._max_chat_buckets = max_chat_buckets
+        self._chats: dict[Any, TokenBucket] = {}
+        self._stats: dict[str, _MethodStats] = {}
+        # Чат и время окончания последнего retry_after — по ним видно, что ограничение общее для бота
+        self._last_retry_after: tuple[Any, float] = (None, 0.0)
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self._max_chat_buckets:
+                # Корзины полностью восстановившихся чатов ничего не ограничивают — их можно забыть
+                self._chats = {cid: b for cid, b in self._chats.items() if not b.idle}
+            # Группы и каналы (отрицательные id и @username) ограничены 20 сообщениями в минуту
+            is_private = isinstance(chat_id, int) and chat_id > 0
+            rate = self._chat_rate if is_private else self._group_rate
+            bucket = self._chats[chat_id] = TokenBucket(rate, self._chat_burst)
+        return bucket
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        if isinstance(method, GetUpdates):
+            # Долгий опрос не ограничивается и не портит статистику задержек
+            return await make_request(bot, method)
+
+        stats = self._stats.setdefault(type(method).__name__, _MethodStats())
+        chat_id = getattr(method, "chat_id", None)
+
+        is_send = _is_send(method)
+        for attempt in range(self._max_retries + 1):
+            if chat_id is not None:
+                bulk = _bulk.get()
+                waited = 0.0
+                if bulk:
+                    waited += await self._bulk.acquire()
+                if is_send:
+                    waited += await self._chat_bucket(chat_id).acquire()
+                waited += await self._global.acquire(low_priority=bulk)
+                if waited > 0.001:
+                    stats.throttled += 1
+                    stats.throttled_wait += waited
+
+            started = time.monotonic()
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                stats.retry_after += 1
+                if attempt == self._max_retries:
+                    raise
+                logger.info(f"[TelegramRateLimiter] {type(method).__name__} {chat_id=}: retry after {e.retry_after}s")
+                self._handle_retry_after(chat_id, e.retry_after)
+                if chat_id is None or not is_send:
+                    # Такие запросы не проходят через корзину чата, поэтому ждут сами
+                    await asyncio.sleep(e.retry_after)
+            except Exception:
+                stats.errors += 1
+                raise
+            finally:
+                latency = time.monotonic() - started
+                stats.calls += 1
+                stats.total_latency += latency
+                stats.max_latency = max(stats.max_latency, latency)
+
+    def _handle_retry_after(self, chat_id: Any, retry_after: float) -> None:
+        now = time.monotonic()
+        last_chat_id, last_until = self._last_retry_after
+        self._last_retry_after = (chat_id, now + retry_after)
+        if chat_id is None or (last_chat_id != chat_id and now < last_until):
+            # Ограничение на весь бот: другие чаты тоже не должны получать 429
+            self._global.block(retry_after)
+        else:
+            self._chat_bucket(chat_id).block(retry_after)
+
+    def format_stats(self) -> str:
+        if not self._stats:
+            return "Запросов к Telegram ещё не было"
+        lines = []
+        for name, s in sorted(self._stats.items(), key=lambda item: -item[1].calls):
+            avg = s.total_latency / s.calls * 1000 if s.calls else 0
+            lines.append(
+                f"{name}: {s.calls} запросов, средн. {avg:.0f} мс, макс. {s.max_latency * 1000:.0f} мс, "
+                f"ожиданий {s.throttled} ({s.throttled_wait:.1f} с), retry_after {s.retry_after}, ошибок {s.errors}"
+            )
+        return "\n".join(lines)
@@ -1,16 +1,20 @@
 import logging
-from math import atan2, cos, radians, sin, sqrt
-from typing import Any
+from typing import Any, Optional
 
 from aiogram import Bot, types
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile, InputMediaAnimation, InputMediaPhoto
 
 from app.bot.base_keyboards import get_places_keyboard
-from app.services import redis_service
+from app.core.settings import Settings
+from app.core.utils import LruCache
 from app.services.db_service import DbService
 from app.services.redis_service import RedisService
 
 logger = logging.getLogger(__name__)
 
+_place_texts = LruCache(Settings.PLACE_TEXT_CACHE_SIZE)
+
 
 # Функции для работы с сообщениями
 async def delete_user_message(message: types.Message):
@@ -21,6 +25,87 @@ async def delete_user_message(message: types.Message):
         logger.error(f"Error while deleting user msg, {e}")
 
 
+def _media_key(media: Any) -> Optional[str]:
+    """
+    Ключ кэша file_id: путь к локальному файлу или URL фото. Уже готовые file_id не кэшируются.
+    """
+    if isinstance(media, FSInputFile):
+        return f"file:{media.path}"
+    if isinstance(media, str) and media.startswith(("http://", "https://")):
+        return media
+    return None
+
+
+async def _send_media(send, media: Any, redis_service: RedisService) -> types.Message:
+    """
+    Отправляет фото или анимацию через send(media), подставляя file_id,
+    полученный Telegram при первой отправке этого файла.
+    """
+    media_key = _media_key(media)
+    file_id = None
+    if media_key:
+        try:
+            file_id = await redis_service.get_media_file_id(media_key)
+        except Exception as e:
+            logger.error(f"Error reading cached file_id for {media_key}: {e}")
+    if file_id:
+        try:
+            return await send(file_id)
+        except TelegramBadRequest as e:
+            if "message is not modified" in str(e):
+                raise
+            # file_id больше не действителен — отправляем исходный файл и запоминаем новый id
+            logger.error(f"Cached file_id for {media_key} rejected: {e}")
+            try:
+                await redis_service.delete_media_file_id(media_key)
+            except Exception as e:
+                logger.error(f"Error deleting cached file_id for {media_key}: {e}")
+
+    message = await send(media)
+    if media_key:
+        sent = message.photo[-1] if message.photo else message.animation or message.video or message.document
+        if sent:
+            try:
+                await redis_service.set_media_file_id(media_key, sent.file_id)
+            except Exception as e:
+                logger.error(f"Error caching file_id for {media_key}: {e}")
+    return message
+
+
+async def send_photo(bot: Bot, redis_service: RedisService, photo: Any, **kwargs) -> types.Message:
+    return await _send_media(lambda media: bot.send_photo(photo=media, **kwargs), photo, redis_service)
+
+
+async def send_animation(bot: Bot, redis_service: RedisService, animation: Any, **kwargs) -> types.Message:
+    return await _send_media(lambda media: bot.send_animation(animation=media, **kwargs), animation, redis_service)
+
+
+async def edit_media(
+    bot: Bot,
+    redis_service: RedisService,
+    chat_id: int,
+    message_id: int,
+    media: Any,
+    caption: str,
+    reply_markup=None,
+    animation: bool = False,
+) -> types.Message:
+    """
+    Заменяет фото или анимацию и подпись в уже отправленном сообщении с медиа одним запросом.
+    """
+    input_media = InputMediaAnimation if animation else InputMediaPhoto
+    return await _send_media(
+        lambda value: bot.edit_message_media(
+            chat_id=chat_id,
+            message_id=message_id,
+            media=input_media(media=value, caption=caption),
+            reply_markup=reply_markup,
+        ),
+        media,
+        redis_service,
+    )
+
+
 async def update_or_send_message(
     chat_id: int,
     text: str,
@@ -31,36 +116,37 @@ async def update_or_send_message(
     gif: str = None,
 ):
     """Обновить существующее сообщение или отправить новое"""
-    last_msg = await redis_service.get_user_msg(chat_id)
+    last_msg, last_has_media = await redis_service.get_user_msg_info(chat_id)
+    media = gif or photo_url
     if last_msg:
         try:
-            if gif:
-                message = await bot.send_animation(
-                    chat_id=chat_id,
-                    animation=gif,
-                    caption=text,
-                    reply_markup=reply_markup,
-                )
-                try:
-                    await bot.delete_message(chat_id=chat_id, message_id=last_msg)
-                except Exception as e:
-                    logger.error(f"Error while deleting user msg, {e}")
-            elif photo_url:
-                # Если есть фото, отправляем новое сообщение с фото
-                message = await bot.send_photo(
-                    chat_id=chat_id,
-                    photo=photo_url,
-                    caption=text,
-                    reply_markup=reply_markup,
-                )
-                # Удаляем старое сообщение
-                try:
-                    await bot.delete_message(chat_id=chat_id, message_id=last_msg)
-                except Exception as e:
-                    logger.error(f"Error while deleting user msg, {e}")
+            if media:
+                message = None
+                if last_has_media:
+                    # Прошлое сообщение тоже с медиа — меняем фото и подпись на месте
+                    try:
+                        message = await edit_media(
+                            bot, redis_service, chat_id, last_msg, media, text, reply_markup, animation=bool(gif)
+                        )
+                    except Exception as edit_error:
+                        logger.error(f"Error editing media message, sending new: {edit_error}")
+                if message is None:
+                    # Если есть фото, отправляем новое сообщение с фото
+                    send = send_animation if gif else send_photo
+                    message = await send(
+                        bot, redis_service, media, chat_id=chat_id, caption=text, reply_markup=reply_markup
+                    )
+                    # Удаляем старое сообщение
+                    try:
+                        await bot.delete_message(chat_id=chat_id, message_id=last_msg)
+                    except Exception as e:
+                        logger.error(f"Error while deleting user msg, {e}")
             else:
                 # Если нет фото, пытаемся отредактировать текстовое сообщение
                 try:
+                    if last_has_media:
+                        # Сообщение с медиа нельзя превратить в текстовое
+                        raise ValueError("previous message has media")
                     message = await bot.edit_message_text(
                         chat_id=chat_id,
                         message_id=last_msg,
@@ -77,22 +163,24 @@ async def update_or_send_message(
                     except Exception as e:
                         logger.error(f"Error while deleting user msg, {e}")
 
-            await redis_service.set_user_msg(chat_id, message.message_id)
+            await redis_service.set_user_msg(chat_id, message.message_id, bool(media))
             return message.message_id
         except Exception as e:
             logger.error(f"Error in update_or_send_message: {e}")
             # Если все попытки не удались, отправляем новое сообщение
             try:
                 if photo_url:
-                    message = await bot.send_photo(
+                    message = await send_photo(
+                        bot,
+                        redis_service,
+                        photo_url,
                         chat_id=chat_id,
-                        photo=photo_url,
                         caption=text,
                         reply_markup=reply_markup,
                     )
                 else:
                     message = await bot.send_message(chat_id=chat_id, text=text, reply_markup=reply_markup)
-                await redis_service.set_user_msg(chat_id, message.message_id)
+                await redis_service.set_user_msg(chat_id, message.message_id, bool(photo_url))
                 return message.message_id
             except Exception as e2:
                 logger.error(f"Error sending new message: {e2}")
@@ -100,26 +188,26 @@ async def update_or_send_message(
     else:
         try:
             if gif:
-                message = await bot.send_animation(
+                message = await send_animation(
+                    bot,
+                    redis_service,
+                    gif,
                     chat_id=chat_id,
-                    animation=gif,
                     caption=text,
                     reply_markup=reply_markup,
                 )
-                try:
-                    await bot.delete_message(chat_id=chat_id, message_id=last_msg)
-                except Exception as e:
-                    logger.error(f"Error while deleting user msg, {e}")
             elif photo_url:
-                message = await bot.send_photo(
+                message = await send_photo(
+                    bot,
+                    redis_service,
+                    photo_url,
                     chat_id=chat_id,
-                    photo=photo_url,
                     caption=text,
                     reply_markup=reply_markup,
                 )
             else:
                 message = await bot.send_message(chat_id=chat_id, text=text, reply_markup=reply_markup)
-            await redis_service.set_user_msg(chat_id, message.message_id)
+            await redis_service.set_user_msg(chat_id, message.message_id, bool(media))
             return message.message_id
         except Exception as e:
             logger.error(f"Error sending message: {e}")
@@ -127,53 +215,25 @@ async def update_or_send_message(
 
 
 async def show_place(
-    user_id: int, chat_id: int, index: int, bot: Bot, db_service: DbService, redis_service: redis_service
+    user_id: int,
+    chat_id: int,
+    index: int,
+    bot: Bot,
+    db_service: DbService,
+    redis_service: RedisService,
+    place: Optional[dict[Any, Any]] = None,
 ):
-    places = (await redis_service.get_user_data(user_id)).get("places", [])
+    if place is None:
+        place = await db_service.get_feed_place(user_id, index)
 
-    if not places or index >= len(places):
+    if not place:
         return
 
-    place = places[index]
-
-    # Формируем текст с рейтингом
-    rating = place.get("rating")
-    rating_text = f"⭐ {rating}/5" if rating else "⭐ Рейтинг не указан"
-
-    # Получаем категории и пожелания места из базы данных и ормируем текст с категориями и пожеланиями
-    categories_text, wishes_text, website = await db_service.get_categories_and_wishes(place)
-    # Получаем геолокацию пользователя
-    user = await db_service.get_user(user_id)
-
-    distance_text = ""
-
-    if user and user["latitude"] and user["longitude"] and place.get("latitude") and place.get("longitude"):
-        try:
-            user_lat = user["latitude"]
-            user_lon = user["longitude"]
-            place_lat = float(place["latitude"])
-            place_lon = float(place["longitude"])
-
-            # Расчет расстояния
-            R = 6371  # Радиус Земли в км
-            lat1_rad = radians(user_lat)
-            lon1_rad = radians(user_lon)
-            lat2_rad = radians(place_lat)
-            lon2_rad = radians(place_lon)
+    # Расстояние посчитано один раз при сборке подборки
+    distance = place.get("distance")
+    distance_text = f"\n<b>Расстояние:</b> {distance:.1f} км от вас" if distance is not None else ""
 
-            dlon = lon2_rad - lon1_rad
-            dlat = lat2_rad - lat1_rad
-
-            a = sin(dlat / 2) ** 2 + cos(lat1_rad) * cos(lat2_rad) * sin(dlon / 2) ** 2
-            c = 2 * atan2(sqrt(a), sqrt(1 - a))
-
-            distance = R * c
-            distance_text = f"\n<b>Расстояние:</b> {distance:.1f} км от вас"
-
-        except (ValueError, TypeError):
-            # Если координаты некорректны, пропускаем
-            pass
-    place_text = generate_place_text(place, website, rating_text, distance_text)
+    place_text = await get_place_text(place, distance_text, db_service)
 
     # Получаем ссылку на фото и проверяем ее валидность
     photo_url = place.get("photo")
@@ -205,7 +265,25 @@ async def show_place(
             chat_id=chat_id, text=place_text, bot=bot, redis_service=redis_service, reply_markup=get_places_keyboard()
         )
     # Помечаем место как просмотренное по названию
-    await db_service.mark_place_as_viewed(user_id, place.get("name"))
+    await db_service.mark_place_as_viewed(user_id, place["id"])
+
+
+async def get_place_text(place: dict[Any, Any], distance_text: str, db_service: DbService) -> str:
+    """
+    Текст карточки места. Готовые тексты кэшируются по id места, версии каталога и расстоянию.
+    """
+    key = (place.get("id"), db_service.catalog_version, distance_text)
+    place_text = _place_texts.get(key)
+    if place_text is None:
+        # Формируем текст с рейтингом
+        rating = place.get("rating")
+        rating_text = f"⭐ {rating}/5" if rating else "⭐ Рейтинг не указан"
+
+        # Категории и пожелания берутся из карточки, а для старых карточек — из базы данных
+        categories_text, wishes_text, website = await db_service.get_categories_and_wishes(place)
+        place_text = generate_place_text(place, website, rating_text, distance_text)
+        _place_texts.put(key, place_text)
+    return place_text
 
 
 def generate_place_text(
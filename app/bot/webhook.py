@@ -0,0 +1,114 @@
+import asyncio
+import hmac
+import logging
+from typing import Awaitable, Callable, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# Проверка готовности зависимости (БД, Redis), должна бросать исключение, если зависимость недоступна
+ReadinessCheck = Callable[[], Awaitable[None]]
+
+
+class WebhookServer:
+    """
+    Приём обновлений от Telegram по вебхуку: aiohttp-сервер проверяет секретный токен, кладёт обновление
+    в ограниченную очередь и сразу отвечает 200, а обработкой занимаются workers обработчиков.
+    Если очередь заполнена, отвечает 503 — Telegram повторит доставку позже.
+    Обновления можно отправлять вручную: POST на path с JSON обновления и заголовком секретного токена.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        dp: Dispatcher,
+        secret_token: str,
+        path: str = "/webhook",
+        workers: int = 16,
+        queue_size: int = 1000,
+        readiness_checks: Optional[list[ReadinessCheck]] = None,
+    ) -> None:
+        self._bot = bot
+        self._dp = dp
+        self._secret_token = secret_token
+        self._path = path
+        self._workers_count = workers
+        self._queue: asyncio.Queue[Update] = asyncio.Queue(maxsize=queue_size)
+        self._readiness_checks = readiness_checks or []
+        self._workers: list[asyncio.Task] = []
+        self._runner: Optional[web.AppRunner] = None
+        self._ready = False
+
+    def _make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self._path, self._handle_update)
+        app.router.add_get("/healthz", self._handle_health)
+        app.router.add_get("/readyz", self._handle_ready)
+        return app
+
+    async def start(self, host: str, port: int) -> None:
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self._workers_count)]
+        self._runner = web.AppRunner(self._make_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        self._ready = True
+        logger.info(f"[Webhook] Listening on {host}:{port}{self._path}")
+
+    async def stop(self, timeout: float = 10) -> None:
+        """
+        Перестаёт принимать обновления и даёт обработчикам до timeout секунд разобрать очередь.
+        """
+        self._ready = False
+        if self._runner is not None:
+            await self._runner.cleanup()
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"[Webhook] {self._queue.qsize()} updates left unprocessed on shutdown")
+        for task in self._workers:
+            task.cancel()
+
+    async def _handle_update(self, request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self._secret_token):
+            return web.Response(status=403)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self._bot})
+        except Exception as e:
+            logger.error(f"[Webhook] Invalid update: {e}")
+            return web.Response(status=400)
+        try:
+            self._queue.put_nowait(update)
+        except asyncio.QueueFull:
+            logger.error(f"[Webhook] Queue is full, update {update.update_id} rejected")
+            return web.Response(status=503)
+        return web.Response()
+
+    async def _handle_health(self, request: web.Request) -> web.Response:
+        return web.Response(text="ok")
+
+    async def _handle_ready(self, request: web.Request) -> web.Response:
+        if not self._ready:
+            return web.Response(status=503, text="starting")
+        if self._queue.full():
+            return web.Response(status=503, text="queue is full")
+        for check in self._readiness_checks:
+            try:
+                await check()
+            except Exception as e:
+                return web.Response(status=503, text=f"{e}")
+        return web.Response(text="ok")
+
+    async def _worker(self) -> None:
+        while True:
+            update = await self._queue.get()
+            try:
+                await self._dp.feed_update(self._bot, update)
+            except Exception as e:
+                logger.error(f"[Webhook] Error while processing update {update.update_id}: {e}")
+            finally:
+                self._queue.task_done()
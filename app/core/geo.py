@@ -0,0 +1,28 @@
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def to_radians(latitude, longitude) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Переводит координаты мест в радианы один раз: (широта, долгота, косинус широты).
+    Некорректные координаты превращаются в NaN.
+    """
+    lat_rad = np.radians(np.asarray(latitude, dtype=np.float64))
+    lon_rad = np.radians(np.asarray(longitude, dtype=np.float64))
+    return lat_rad, lon_rad, np.cos(lat_rad)
+
+
+def haversine_km(
+    user_lat: float, user_lon: float, lat_rad: np.ndarray, lon_rad: np.ndarray, cos_lat: np.ndarray
+) -> np.ndarray:
+    """
+    Расстояние от пользователя до каждого места в км по формуле гаверсинусов.
+    """
+    user_lat_rad = np.radians(user_lat)
+    user_lon_rad = np.radians(user_lon)
+    a = (
+        np.sin((lat_rad - user_lat_rad) / 2) ** 2
+        + np.cos(user_lat_rad) * cos_lat * np.sin((lon_rad - user_lon_rad) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
@@ -2,36 +2,33 @@ import pytz
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
-from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.jobstores.memory import MemoryJobStore
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from redis.asyncio import Redis
 
+from app.bot.broadcast import BroadcastEngine
+from app.bot.rate_limiter import TelegramRateLimiter
 from app.core.settings import Settings
 from app.repositories.db_repo import DbRepo
 from app.repositories.redis_repo import RedisRepo
 from app.services.coordinator import Coordinator
 from app.services.db_service import DbService
+from app.services.job_store import AsyncpgJobStore
+from app.services.place_catalog import PlaceCatalog
 from app.services.redis_service import RedisService
 
 bot = Bot(token=Settings.BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+telegram_limiter = TelegramRateLimiter(
+    global_rate=Settings.TG_GLOBAL_RATE,
+    bulk_rate=Settings.TG_BULK_RATE,
+    chat_rate=Settings.TG_CHAT_RATE,
+    chat_burst=Settings.TG_CHAT_BURST,
+    group_rate_per_minute=Settings.TG_GROUP_RATE_PER_MINUTE,
+    max_retries=Settings.TG_MAX_RETRIES,
+)
+bot.session.middleware(telegram_limiter)
 dp = Dispatcher()
 
-jobstores = {
-    "default": SQLAlchemyJobStore(
-        url=(
-            f"postgresql+psycopg2://{Settings.POSTGRES_USER}:"
-            f"{Settings.POSTGRES_PASSWORD}@"
-            f"{Settings.POSTGRES_HOST}:"
-            f"{Settings.POSTGRES_PORT}/"
-            f"{Settings.POSTGRES_DB}"
-        )
-    )
-}
-scheduler = AsyncIOScheduler(jobstores=jobstores, timezone=pytz.timezone("Europe/Moscow"))
-
-db_repo = DbRepo()
-db_service = DbService(db_repo)
-
 redis_repo = RedisRepo(Redis(
     host=Settings.REDIS_HOST,
     port=Settings.REDIS_PORT,
@@ -40,4 +37,36 @@ redis_repo = RedisRepo(Redis(
 ))
 redis_service = RedisService(redis_repo)
 
+db_repo = DbRepo()
+job_store = AsyncpgJobStore(db_repo)
+jobstores = {
+    "default": job_store,
+    # Периодические задачи процесса, которые не нужно хранить в БД
+    "memory": MemoryJobStore(),
+}
+scheduler = AsyncIOScheduler(jobstores=jobstores, timezone=pytz.timezone("Europe/Moscow"))
+place_catalog = PlaceCatalog(db_repo)
+db_service = DbService(
+    db_repo,
+    ranking=Settings.PLACES_RANKING,
+    catalog=place_catalog,
+    nearby_radius_km=Settings.NEARBY_RADIUS_KM,
+    redis_service=redis_service,
+    ranking_cache_ttl=Settings.RANKING_CACHE_TTL,
+    ranking_cache_max_keys=Settings.RANKING_CACHE_MAX_KEYS,
+    ranking_cache_depth=Settings.RANKING_CACHE_DEPTH,
+    place_card_ttl=Settings.PLACE_CARD_TTL,
+    activity_flush_max_events=Settings.ACTIVITY_FLUSH_MAX_EVENTS,
+    interaction_flush_max_events=Settings.INTERACTION_FLUSH_MAX_EVENTS,
+    user_profile_ttl=Settings.USER_PROFILE_TTL,
+)
+
 coordinator = Coordinator(db_service, redis_service)
+broadcast_engine = BroadcastEngine(
+    bot,
+    db_service,
+    redis_service,
+    workers=Settings.BROADCAST_WORKERS,
+    progress_interval=Settings.BROADCAST_PROGRESS_SECONDS,
+    chunk_size=Settings.BROADCAST_CHUNK_SIZE,
+)
@@ -18,3 +18,40 @@ class Settings:
 
     BOT_TOKEN = os.getenv("BOT_TOKEN")
     MODERATORS_CHAT_ID = int(os.getenv("MODERATORS_CHAT_ID", 0))
+
+    # catalog | sql | python
+    PLACES_RANKING = os.getenv("PLACES_RANKING", "catalog")
+    PLACE_CATALOG_REFRESH_SECONDS = int(os.getenv("PLACE_CATALOG_REFRESH_SECONDS", 60))
+    NEARBY_RADIUS_KM = float(os.getenv("NEARBY_RADIUS_KM", 50))
+    RANKING_CACHE_TTL = int(os.getenv("RANKING_CACHE_TTL", 3600))
+    RANKING_CACHE_MAX_KEYS = int(os.getenv("RANKING_CACHE_MAX_KEYS", 1000))
+    RANKING_CACHE_DEPTH = int(os.getenv("RANKING_CACHE_DEPTH", 2000))
+    PLACE_CARD_TTL = int(os.getenv("PLACE_CARD_TTL", 86400))
+    ACTIVITY_FLUSH_SECONDS = int(os.getenv("ACTIVITY_FLUSH_SECONDS", 5))
+    ACTIVITY_FLUSH_MAX_EVENTS = int(os.getenv("ACTIVITY_FLUSH_MAX_EVENTS", 500))
+    INTERACTION_FLUSH_SECONDS = int(os.getenv("INTERACTION_FLUSH_SECONDS", 5))
+    INTERACTION_FLUSH_MAX_EVENTS = int(os.getenv("INTERACTION_FLUSH_MAX_EVENTS", 500))
+    USER_PROFILE_TTL = int(os.getenv("USER_PROFILE_TTL", 3600))
+    PLACE_TEXT_CACHE_SIZE = int(os.getenv("PLACE_TEXT_CACHE_SIZE", 4096))
+    TG_GLOBAL_RATE = float(os.getenv("TG_GLOBAL_RATE", 30))
+    TG_BULK_RATE = float(os.getenv("TG_BULK_RATE", 20))
+    TG_CHAT_RATE = float(os.getenv("TG_CHAT_RATE", 1))
+    TG_CHAT_BURST = float(os.getenv("TG_CHAT_BURST", 3))
+    TG_GROUP_RATE_PER_MINUTE = float(os.getenv("TG_GROUP_RATE_PER_MINUTE", 20))
+    TG_MAX_RETRIES = int(os.getenv("TG_MAX_RETRIES", 3))
+    BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", 8))
+    BROADCAST_PROGRESS_SECONDS = float(os.getenv("BROADCAST_PROGRESS_SECONDS", 10))
+    BROADCAST_CHUNK_SIZE = int(os.getenv("BROADCAST_CHUNK_SIZE", 1000))
+    MSG_DELETE_INTERVAL_SECONDS = int(os.getenv("MSG_DELETE_INTERVAL_SECONDS", 5))
+    MSG_DELETE_BATCH_SIZE = int(os.getenv("MSG_DELETE_BATCH_SIZE", 100))
+
+    # polling | webhook
+    BOT_MODE = os.getenv("BOT_MODE", "polling")
+    # Публичный адрес бота без пути; если не задан, вебхук не регистрируется в Telegram (локальная проверка)
+    WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+    WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+    WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+    WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+    WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8080))
+    WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", 16))
+    WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", 1000))
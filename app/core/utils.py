@@ -1,4 +1,6 @@
+from collections import OrderedDict
 from functools import wraps
+from typing import Any, Hashable, Optional
 
 
 def sync_log_decorator(module_logger):
@@ -31,3 +33,25 @@ def async_log_decorator(module_logger):
         return wrapper
 
     return decorator
+
+
+class LruCache:
+    """
+    Простой LRU-кэш в памяти процесса: при переполнении вытесняется давно не читанный ключ.
+    """
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        self._maxsize = maxsize
+        self._data: OrderedDict[Hashable, Any] = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        if key not in self._data:
+            return None
+        self._data.move_to_end(key)
+        return self._data[key]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self._maxsize:
+            self._data.popitem(last=False)
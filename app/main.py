@@ -1,18 +1,78 @@
 import asyncio
 import logging
+import signal
 import time
 
 from aiogram.types import BotCommand
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 
 from app.bot.admin_handlers import admin_router
 from app.bot.base_handlers import base_router
-from app.bot.jobs import reset_daily_count
-from app.core.instances import bot, coordinator, db_service, dp, redis_service, scheduler
+from app.bot.jobs import (
+    delete_due_messages,
+    flush_place_interactions,
+    flush_user_activity,
+    refresh_place_catalog,
+    reset_daily_count,
+    resume_broadcasts,
+)
+from app.bot.middlewares import RequestScopeMiddleware
+from app.bot.webhook import WebhookServer
+from app.core.instances import (
+    bot,
+    coordinator,
+    db_service,
+    dp,
+    job_store,
+    redis_service,
+    scheduler,
+    telegram_limiter,
+)
 from app.core.settings import Settings
 
 logger = logging.getLogger(__name__)
 
+# Фоновые задачи процесса; ссылки держатся до остановки, чтобы задачи не собрал сборщик мусора
+background_tasks: set[asyncio.Task] = set()
+
+
+async def run_webhook() -> None:
+    if not Settings.WEBHOOK_SECRET:
+        raise ValueError("WEBHOOK_SECRET is required in webhook mode")
+
+    server = WebhookServer(
+        bot,
+        dp,
+        Settings.WEBHOOK_SECRET,
+        path=Settings.WEBHOOK_PATH,
+        workers=Settings.WEBHOOK_WORKERS,
+        queue_size=Settings.WEBHOOK_QUEUE_SIZE,
+        readiness_checks=[db_service.ping, redis_service.ping],
+    )
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    workflow_data = {"dispatcher": dp, "bots": [bot], **dp.workflow_data}
+    await dp.emit_startup(bot=bot, **workflow_data)
+    await server.start(Settings.WEBHOOK_HOST, Settings.WEBHOOK_PORT)
+    try:
+        if Settings.WEBHOOK_URL:
+            await bot.set_webhook(
+                f"{Settings.WEBHOOK_URL.rstrip('/')}{Settings.WEBHOOK_PATH}",
+                secret_token=Settings.WEBHOOK_SECRET,
+                allowed_updates=dp.resolve_used_update_types(),
+            )
+        else:
+            logger.info("WEBHOOK_URL is not set, webhook is not registered in Telegram")
+        await stop_event.wait()
+    finally:
+        await server.stop()
+        await dp.emit_shutdown(bot=bot, **workflow_data)
+        await bot.session.close()
+
 
 async def main():
     logging.Formatter.converter = time.localtime
@@ -32,6 +92,11 @@ async def main():
         )
 
         await db_service.create_tables()
+        await db_service.sync_places()
+        await db_service.load_place_catalog()
+        migrated = await redis_service.migrate_legacy_sessions(Settings.PLACE_CARD_TTL)
+        if migrated:
+            logger.info(f"Migrated {migrated} legacy user sessions")
 
         routers = [base_router, admin_router]
         for router in routers:
@@ -41,6 +106,8 @@ async def main():
         dp["db_service"] = db_service
         dp["redis_service"] = redis_service
         dp["coordinator"] = coordinator
+        dp["telegram_limiter"] = telegram_limiter
+        dp.update.outer_middleware(RequestScopeMiddleware(db_service))
 
         commands = [
             BotCommand(command="start", description="Перезапуск бота"),
@@ -55,13 +122,57 @@ async def main():
             id="daily_count_reset",
             replace_existing=True,
         )
+        scheduler.add_job(
+            refresh_place_catalog,
+            IntervalTrigger(seconds=Settings.PLACE_CATALOG_REFRESH_SECONDS),
+            id="place_catalog_refresh",
+            jobstore="memory",
+            replace_existing=True,
+        )
+        scheduler.add_job(
+            flush_user_activity,
+            IntervalTrigger(seconds=Settings.ACTIVITY_FLUSH_SECONDS),
+            id="user_activity_flush",
+            jobstore="memory",
+            replace_existing=True,
+        )
+        scheduler.add_job(
+            flush_place_interactions,
+            IntervalTrigger(seconds=Settings.INTERACTION_FLUSH_SECONDS),
+            id="place_interactions_flush",
+            jobstore="memory",
+            replace_existing=True,
+        )
+        scheduler.add_job(
+            delete_due_messages,
+            IntervalTrigger(seconds=Settings.MSG_DELETE_INTERVAL_SECONDS),
+            id="due_messages_delete",
+            jobstore="memory",
+            replace_existing=True,
+        )
 
         scheduler.start()
+        await job_store.wait_loaded()
         logger.info(f"Scheduler jobs: {scheduler.get_jobs()}")
 
-        await dp.start_polling(bot)
+        # Рассылки, прерванные прошлой остановкой бота, продолжаются в фоне
+        background_tasks.add(asyncio.create_task(resume_broadcasts()))
+
+        if Settings.BOT_MODE == "webhook":
+            await run_webhook()
+        else:
+            # Telegram не отдаёт обновления через getUpdates, пока установлен вебхук
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
 
     finally:
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        background_tasks.clear()
+        await db_service.flush_user_activity()
+        await db_service.flush_place_interactions()
+        await job_store.flush()
         await db_service.close_db()
         await redis_service.close_redis()
 
@@ -1,6 +1,10 @@
+import asyncio
+import json
 import logging
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from datetime import datetime, timedelta
-from typing import Any, Optional
+from typing import Any, AsyncIterator, Awaitable, Callable, Hashable, Optional
 
 import asyncpg
 import pytz
@@ -8,9 +12,68 @@ import pytz
 logger = logging.getLogger(__name__)
 
 
+class _Lease:
+    """
+    Соединение, которое одалживается всем запросам репозитория внутри DbRepo.session().
+    Берётся из пула лениво — при первом запросе.
+    """
+
+    def __init__(self, transaction: bool) -> None:
+        self.task = asyncio.current_task()
+        self.transaction = transaction
+        self.conn: Optional[asyncpg.Connection] = None
+        self.tr: Optional[asyncpg.transaction.Transaction] = None
+
+
+class _BatchLoader:
+    """
+    Собирает ключи, запрошенные за один проход цикла событий, и загружает их одним запросом fetch_many.
+    Запрос выполняется в отдельной задаче со своим соединением из пула. Обработчики апдейтов работают
+    вне session(), поэтому их одиночные чтения идут через загрузчик; внутри session(), уже занявшей
+    соединение, чтения идут через него (см. DbRepo._reads_through_lease).
+    """
+
+    def __init__(self, fetch_many: Callable[[list[Hashable]], Awaitable[dict[Hashable, Any]]]) -> None:
+        self._fetch_many = fetch_many
+        self._pending: dict[Hashable, list[asyncio.Future]] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def load(self, key: Hashable) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        if not self._pending:
+            loop.call_soon(self._dispatch)
+        future = loop.create_future()
+        self._pending.setdefault(key, []).append(future)
+        return future
+
+    def _dispatch(self) -> None:
+        pending, self._pending = self._pending, {}
+        task = asyncio.create_task(self._resolve(pending))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _resolve(self, pending: dict[Hashable, list[asyncio.Future]]) -> None:
+        try:
+            rows = await self._fetch_many(list(pending))
+        except Exception as e:
+            for futures in pending.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+        for key, futures in pending.items():
+            for future in futures:
+                if not future.done():
+                    future.set_result(rows.get(key))
+
+
 class DbRepo:
     def __init__(self) -> None:
         self._pool: Optional[asyncpg.pool.Pool] = None
+        self._lease: ContextVar[Optional[_Lease]] = ContextVar("db_lease", default=None)
+        self._users_loader = _BatchLoader(self._fetch_users)
+        self._user_stats_loader = _BatchLoader(self._fetch_user_stats)
+        self._place_details_loader = _BatchLoader(self._fetch_place_details)
 
     async def init(self, user, password, database, host, port, min_size=10, max_size=30) -> None:
         if self._pool is None:
@@ -28,8 +91,73 @@ class DbRepo:
         if self._pool:
             await self._pool.close()
 
+    async def ping(self) -> None:
+        async with self._acquire() as conn:
+            await conn.fetchval("SELECT 1")
+
+    @asynccontextmanager
+    async def session(self, transaction: bool = False) -> AsyncIterator[None]:
+        """
+        Единица работы: все запросы репозитория внутри блока идут через одно соединение из пула
+        (и, если transaction=True, в одной транзакции). Вложенные session() используют внешнее соединение,
+        вложенная session(transaction=True) внутри блока без транзакции открывает транзакцию на нём.
+        Соединение занято до конца блока, поэтому внутри не должно быть ожиданий, не связанных с БД.
+        """
+        outer = self._lease.get()
+        if outer is not None and outer.task is asyncio.current_task():
+            if transaction and not outer.transaction:
+                async with self._acquire() as conn, conn.transaction():
+                    yield
+            else:
+                yield
+            return
+
+        lease = _Lease(transaction)
+        token = self._lease.set(lease)
+        try:
+            yield
+            if lease.tr is not None:
+                await lease.tr.commit()
+        except BaseException:
+            if lease.tr is not None:
+                await lease.tr.rollback()
+            raise
+        finally:
+            self._lease.reset(token)
+            if lease.conn is not None:
+                await self._pool.release(lease.conn)
+
+    @asynccontextmanager
+    async def _acquire(self) -> AsyncIterator[asyncpg.Connection]:
+        lease = self._lease.get()
+        # Задачи, запущенные из обработчика, наследуют контекст, но соединение им не одалживается
+        if lease is None or lease.task is not asyncio.current_task():
+            async with self._pool.acquire() as conn:
+                yield conn
+            return
+
+        if lease.conn is None:
+            lease.conn = await self._pool.acquire()
+            if lease.transaction:
+                tr = lease.conn.transaction()
+                await tr.start()
+                lease.tr = tr
+        yield lease.conn
+
+    def _reads_through_lease(self) -> bool:
+        """
+        Читать ли напрямую через соединение session() текущей задачи, а не через _BatchLoader.
+        Пока session() ещё не заняла соединение (и не открывает транзакцию), загрузчик ничего не стоит:
+        его запрос берёт соединение из пула и сразу возвращает. Иначе загрузчик занял бы второе соединение,
+        а в транзакции прочитал бы данные мимо неё.
+        """
+        lease = self._lease.get()
+        if lease is None or lease.task is not asyncio.current_task():
+            return False
+        return lease.conn is not None or lease.transaction
+
     async def create_tables(self) -> None:
-        async with self._pool.acquire() as conn:
+        async with self._acquire() as conn:
             await conn.execute("""
                 CREATE TABLE IF NOT EXISTS users (
                     id SERIAL PRIMARY KEY,
@@ -69,46 +197,263 @@ class DbRepo:
                 );
                 """)
 
+            # Нормализованные фильтры, категории и пожелания мест: считаются триггером при записи места
+            # по справочникам из place_tag_vocabularies, sync_places_tags обновляет справочники и старые строки
+            await conn.execute("""
+                ALTER TABLE places
+                    ADD COLUMN IF NOT EXISTS first_filter TEXT,
+                    ADD COLUMN IF NOT EXISTS filter_ids INTEGER[],
+                    ADD COLUMN IF NOT EXISTS category_ids INTEGER[],
+                    ADD COLUMN IF NOT EXISTS wish_ids INTEGER[];
+                CREATE INDEX IF NOT EXISTS places_filter_ids_idx ON places USING GIN (filter_ids);
+                CREATE INDEX IF NOT EXISTS places_category_ids_idx ON places USING GIN (category_ids);
+                CREATE INDEX IF NOT EXISTS places_wish_ids_idx ON places USING GIN (wish_ids);
+
+                CREATE TABLE IF NOT EXISTS place_tag_vocabularies (
+                    kind TEXT PRIMARY KEY,
+                    tags TEXT[] NOT NULL
+                );
+
+                CREATE OR REPLACE FUNCTION place_tag_ids(tags_str TEXT, vocabulary TEXT[]) RETURNS INTEGER[] AS $$
+                    SELECT ARRAY(
+                        SELECT DISTINCT array_position(vocabulary, btrim(c)) - 1
+                        FROM unnest(string_to_array(tags_str, ',')) AS t(c)
+                        WHERE btrim(c) = ANY(vocabulary)
+                        ORDER BY 1
+                    )
+                $$ LANGUAGE sql IMMUTABLE;
+
+                CREATE OR REPLACE FUNCTION place_first_filter(tags_str TEXT) RETURNS TEXT AS $$
+                    SELECT COALESCE(
+                        (
+                            SELECT btrim(c)
+                            FROM unnest(string_to_array(tags_str, ',')) WITH ORDINALITY AS t(c, n)
+                            WHERE btrim(c) <> ''
+                            ORDER BY n
+                            LIMIT 1
+                        ),
+                        'other'
+                    )
+                $$ LANGUAGE sql IMMUTABLE;
+
+                CREATE OR REPLACE FUNCTION set_place_tags() RETURNS trigger AS $$
+                DECLARE
+                    filters TEXT[];
+                    categories TEXT[];
+                    wishes TEXT[];
+                BEGIN
+                    SELECT tags INTO filters FROM place_tag_vocabularies WHERE kind = 'filters';
+                    SELECT tags INTO categories FROM place_tag_vocabularies WHERE kind = 'categories';
+                    SELECT tags INTO wishes FROM place_tag_vocabularies WHERE kind = 'wishes';
+                    NEW.first_filter := place_first_filter(NEW.categories_ya);
+                    NEW.filter_ids := place_tag_ids(NEW.categories_ya, COALESCE(filters, '{}'));
+                    NEW.category_ids := place_tag_ids(NEW.categories_1, COALESCE(categories, '{}'));
+                    NEW.wish_ids := place_tag_ids(NEW.categories_2, COALESCE(wishes, '{}'));
+                    RETURN NEW;
+                END
+                $$ LANGUAGE plpgsql;
+
+                CREATE OR REPLACE TRIGGER places_tags
+                BEFORE INSERT OR UPDATE OF categories_ya, categories_1, categories_2 ON places
+                FOR EACH ROW EXECUTE FUNCTION set_place_tags();
+                """)
+
+            # Версия каталога мест: увеличивается, когда запрос к places действительно изменил строки.
+            # Запросы, не затронувшие ни одной строки (например, дозаполнение при старте), версию не меняют
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS catalog_version (
+                    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+                    version BIGINT NOT NULL DEFAULT 0
+                );
+                INSERT INTO catalog_version DEFAULT VALUES ON CONFLICT DO NOTHING;
+
+                CREATE OR REPLACE FUNCTION bump_catalog_version() RETURNS trigger AS $$
+                DECLARE
+                    changed BOOLEAN := TG_OP = 'TRUNCATE';
+                BEGIN
+                    -- Каждая ветка обращается только к той таблице переходов, что есть у её триггера
+                    IF TG_OP = 'DELETE' THEN
+                        changed := EXISTS (SELECT 1 FROM old_rows);
+                    ELSIF TG_OP IN ('INSERT', 'UPDATE') THEN
+                        changed := EXISTS (SELECT 1 FROM new_rows);
+                    END IF;
+                    IF changed THEN
+                        UPDATE catalog_version SET version = version + 1;
+                    END IF;
+                    RETURN NULL;
+                END
+                $$ LANGUAGE plpgsql;
+
+                DROP TRIGGER IF EXISTS places_catalog_version ON places;
+
+                CREATE OR REPLACE TRIGGER places_catalog_version_insert
+                AFTER INSERT ON places REFERENCING NEW TABLE AS new_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
+
+                CREATE OR REPLACE TRIGGER places_catalog_version_update
+                AFTER UPDATE ON places REFERENCING NEW TABLE AS new_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
+
+                CREATE OR REPLACE TRIGGER places_catalog_version_delete
+                AFTER DELETE ON places REFERENCING OLD TABLE AS old_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
+
+                CREATE OR REPLACE TRIGGER places_catalog_version_truncate
+                AFTER TRUNCATE ON places
+                FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
+                """)
+
+            # Одна запись логов на пользователя (старые дубликаты удаляются один раз перед созданием индекса)
+            await conn.execute("""
+                DO $$
+                BEGIN
+                    IF to_regclass('logs_user_id_key') IS NULL THEN
+                        DELETE FROM logs a USING logs b WHERE a.user_id = b.user_id AND a.id < b.id;
+                        CREATE UNIQUE INDEX logs_user_id_key ON logs (user_id);
+                    END IF;
+                END
+                $$;
+                """)
+
+            # Счётчик просмотренных мест пользователя, поддерживается триггером на users_places
+            async with conn.transaction():
+                await conn.execute("""
+                    DO $$
+                    BEGIN
+                        IF NOT EXISTS (
+                            SELECT 1 FROM information_schema.columns
+                            WHERE table_name = 'users' AND column_name = 'viewed_places_count'
+                        ) THEN
+                            ALTER TABLE users ADD COLUMN viewed_places_count INTEGER NOT NULL DEFAULT 0;
+                            LOCK TABLE users_places IN SHARE MODE;
+                            UPDATE users u SET viewed_places_count = c.cnt
+                            FROM (
+                                SELECT user_id, COUNT(*) AS cnt
+                                FROM users_places
+                                WHERE viewed = TRUE
+                                GROUP BY user_id
+                            ) AS c
+                            WHERE u.id = c.user_id;
+                        END IF;
+                    END
+                    $$;
+
+                    CREATE OR REPLACE FUNCTION count_viewed_places() RETURNS trigger AS $$
+                    BEGIN
+                        IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.viewed IS TRUE THEN
+                            UPDATE users SET viewed_places_count = viewed_places_count - 1 WHERE id = OLD.user_id;
+                        END IF;
+                        IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.viewed IS TRUE THEN
+                            UPDATE users SET viewed_places_count = viewed_places_count + 1 WHERE id = NEW.user_id;
+                        END IF;
+                        RETURN NULL;
+                    END
+                    $$ LANGUAGE plpgsql;
+
+                    CREATE OR REPLACE TRIGGER users_places_viewed_insert
+                    AFTER INSERT ON users_places
+                    FOR EACH ROW WHEN (NEW.viewed IS TRUE) EXECUTE FUNCTION count_viewed_places();
+
+                    CREATE OR REPLACE TRIGGER users_places_viewed_update
+                    AFTER UPDATE OF viewed ON users_places
+                    FOR EACH ROW WHEN (OLD.viewed IS DISTINCT FROM NEW.viewed) EXECUTE FUNCTION count_viewed_places();
+
+                    CREATE OR REPLACE TRIGGER users_places_viewed_delete
+                    AFTER DELETE ON users_places
+                    FOR EACH ROW WHEN (OLD.viewed IS TRUE) EXECUTE FUNCTION count_viewed_places();
+                    """)
+
+            # Точка места на сфере для поиска ближайших: считается триггером при записи места,
+            # sync_places_points только дозаполняет строки, записанные до появления триггера
+            await conn.execute("""
+                CREATE EXTENSION IF NOT EXISTS cube;
+                CREATE EXTENSION IF NOT EXISTS earthdistance;
+                ALTER TABLE places ADD COLUMN IF NOT EXISTS earth_point earth;
+                CREATE INDEX IF NOT EXISTS places_earth_point_idx ON places USING GIST (earth_point);
+
+                CREATE OR REPLACE FUNCTION set_place_earth_point() RETURNS trigger AS $$
+                BEGIN
+                    NEW.earth_point := CASE
+                        WHEN NEW.latitude IS NULL OR NEW.longitude IS NULL THEN NULL
+                        ELSE ll_to_earth(NEW.latitude::double precision, NEW.longitude::double precision)
+                    END;
+                    RETURN NEW;
+                END
+                $$ LANGUAGE plpgsql;
+
+                CREATE OR REPLACE TRIGGER places_earth_point
+                BEFORE INSERT OR UPDATE OF latitude, longitude ON places
+                FOR EACH ROW EXECUTE FUNCTION set_place_earth_point();
+                """)
+
+            # Задачи планировщика (AsyncpgJobStore), схема совпадает с прежним SQLAlchemyJobStore
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS apscheduler_jobs (
+                    id VARCHAR(191) PRIMARY KEY,
+                    next_run_time DOUBLE PRECISION,
+                    job_state BYTEA NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS ix_apscheduler_jobs_next_run_time ON apscheduler_jobs (next_run_time);
+                """)
+
     async def get_user_stats(self, user_id: int) -> asyncpg.Record:
         """
         Получает статистику пользователя из таблицы logs
         """
-        async with self._pool.acquire() as conn:
-            try:
-                return await conn.fetchrow(
-                    """
-                SELECT activity_date, viewed_places_count, has_geolocation, 
+        try:
+            if not self._reads_through_lease():
+                return await self._user_stats_loader.load(user_id)
+            return (await self._fetch_user_stats([user_id])).get(user_id)
+        except Exception as e:
+            logger.error(f"Error while getting user stats: {e}")
+            return []
+
+    async def _fetch_user_stats(self, user_ids: list[int]) -> dict[int, asyncpg.Record]:
+        async with self._acquire() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT user_id, activity_date, viewed_places_count, has_geolocation, 
                 last_buttons, total_activities
-                FROM logs WHERE user_id = $1
+                FROM logs WHERE user_id = ANY($1::bigint[])
                 """,
-                    user_id,
-                )
-            except Exception as e:
-                logger.error(f"Error while getting user stats: {e}")
-                return []
+                user_ids,
+            )
+            return {row["user_id"]: row for row in rows}
 
     # Получаем категории и пожелания места из базы данных
     async def get_categories_and_wishes(self, name: str, address: str) -> asyncpg.Record:
-        async with self._pool.acquire() as conn:
-            return await conn.fetchrow(
+        if not self._reads_through_lease():
+            return await self._place_details_loader.load((name, address))
+        return (await self._fetch_place_details([(name, address)])).get((name, address))
+
+    async def _fetch_place_details(self, keys: list[tuple[str, str]]) -> dict[tuple[str, str], asyncpg.Record]:
+        names, addresses = map(list, zip(*keys))
+        async with self._acquire() as conn:
+            rows = await conn.fetch(
                 """
-                SELECT categories_1, categories_2, website FROM places 
-                WHERE name = $1 AND address = $2
+                SELECT p.name, p.address, p.categories_1, p.categories_2, p.website
+                FROM places p
+                JOIN unnest($1::text[], $2::text[]) AS k(name, address)
+                ON p.name = k.name AND p.address = k.address
                 """,
-                name,
-                address,
+                names,
+                addresses,
             )
+            return {(row["name"], row["address"]): row for row in rows}
 
     async def get_user(self, user_id: int) -> Optional[asyncpg.Record]:
-        async with self._pool.acquire() as conn:
-            return await conn.fetchrow(
-                "SELECT * FROM users WHERE id = $1",
-                user_id,
-            )
+        if not self._reads_through_lease():
+            return await self._users_loader.load(user_id)
+        return (await self._fetch_users([user_id])).get(user_id)
+
+    async def _fetch_users(self, user_ids: list[int]) -> dict[int, asyncpg.Record]:
+        async with self._acquire() as conn:
+            rows = await conn.fetch("SELECT * FROM users WHERE id = ANY($1::bigint[])", user_ids)
+            return {row["id"]: row for row in rows}
 
-    async def get_users_ids(self) -> list[asyncpg.Record]:
-        async with self._pool.acquire() as conn:
-            return await conn.fetch("SELECT id FROM users")
+    async def get_users_ids_after(self, after_id: int, limit: int) -> list[asyncpg.Record]:
+        async with self._acquire() as conn:
+            return await conn.fetch("SELECT id FROM users WHERE id > $1 ORDER BY id LIMIT $2", after_id, limit)
 
     async def update_user(
         self,
@@ -119,7 +464,7 @@ class DbRepo:
         latitude: float = None,
         longitude: float = None,
     ) -> None:
-        async with self._pool.acquire() as conn:
+        async with self._acquire() as conn:
             await conn.execute(
                 """
                 UPDATE users 
@@ -147,7 +492,7 @@ class DbRepo:
         latitude: float = None,
         longitude: float = None,
     ) -> None:
-        async with self._pool.acquire() as conn:
+        async with self._acquire() as conn:
             await conn.execute(
                 """
                 INSERT INTO users (
@@ -168,129 +513,87 @@ class DbRepo:
                 longitude,
             )
 
-    async def get_viewed_places_count(self, user_id: int) -> int:
-        try:
-            async with self._pool.acquire() as conn:
-                return await conn.fetchval(
-                    """
-                    SELECT COUNT(*) 
-                    FROM users_places  
-                    WHERE viewed = TRUE AND user_id = $1
-                    """,
-                    user_id,
-                )
-        except Exception as e:
-            logger.error(f"Error while getting views places count {e}")
-            return 0
-
-    async def log_exists(self, user_id: int) -> bool:
-        async with self._pool.acquire() as conn:
-            row = await conn.fetchrow("SELECT user_id FROM logs WHERE user_id = $1", user_id)
-            return True if row else False
-
     async def user_places_relations_exists(self, user_id: int) -> None:
-        async with self._pool.acquire() as conn:
+        async with self._acquire() as conn:
             rows = await conn.fetch("SELECT * FROM users_places WHERE user_id = $1", user_id)
             return rows != []
 
-    async def get_last_buttons(self, user_id: int) -> asyncpg.Record:
-        async with self._pool.acquire() as conn:
-            return await conn.fetchrow(
-                "SELECT last_buttons, total_activities FROM logs WHERE user_id = $1",
-                user_id,
-            )
-    
-    async def get_filt_cat_wish(self, user_id: int) -> asyncpg.Record:
-        async with self._pool.acquire() as conn:
-            return await conn.fetchrow(
-                "SELECT filters, categories, wishes FROM logs WHERE user_id = $1",
-                user_id,
-            )
-
-    async def update_logs(
-        self,
-        user_id: int,
-        viewed_places_count: int,
-        has_geolocation: bool,
-        last_buttons: str,
-        total_activities: int,
-        filters: bool,
-        categories: bool,
-        wishes: bool,
-    ) -> None:
-        async with self._pool.acquire() as conn:
-            await conn.execute(
-                """
-                UPDATE logs 
-                SET activity_date = $1, 
-                    viewed_places_count = $2, 
-                    has_geolocation = $3, 
-                    last_buttons = $4,
-                    total_activities = $5,
-                    filters = $6,
-                    categories = $7,
-                    wishes = $8
-                WHERE user_id = $9
-                """,
-                datetime.now(pytz.utc),
-                viewed_places_count,
-                has_geolocation,
-                last_buttons,
-                total_activities,
-                filters,
-                categories,
-                wishes,
-                user_id,
-            )
-
     async def get_users_count(self) -> int:
-        async with self._pool.acquire() as conn:
+        async with self._acquire() as conn:
             return await conn.fetchval(
                 """
                 SELECT COUNT(*) FROM users
                 """
             )
 
-    async def create_user_log(
-        self,
-        user_id: int,
-        viewed_places_count: int,
-        has_geolocation: bool,
-        last_buttons: str,
-        filters: bool,
-        categories: bool,
-        wishes: bool
-    ) -> None:
-        async with self._pool.acquire() as conn:
-            (
-                await conn.execute(
-                    """
-                INSERT INTO logs (
-                user_id, 
-                activity_date, 
-                viewed_places_count, 
-                has_geolocation, 
-                last_buttons, 
-                total_activities,
-                filters,
-                categories,
-                wishes
-                )
-                VALUES ($1, $2, $3, $4, $5, 1, $6, $7, $8)
-                """,
+    async def upsert_user_logs(self, logs: list[tuple[int, datetime, list[str], int, int, bool, bool, bool]]) -> None:
+        """
+        Пачкой создаёт или обновляет записи пользователей в logs.
+        Каждая запись: (user_id, время активности, новые кнопки, сколько последних кнопок оставить,
+        число действий, подтверждены ли фильтры, категории, пожелания).
+        """
+        async with self._acquire() as conn:
+            await conn.executemany(
+                """
+                INSERT INTO logs AS l (
                     user_id,
-                    datetime.now(pytz.utc),
+                    activity_date,
                     viewed_places_count,
                     has_geolocation,
                     last_buttons,
+                    total_activities,
                     filters,
                     categories,
-                    wishes,
-                ),
+                    wishes
+                )
+                SELECT
+                    u.id,
+                    $2::timestamptz,
+                    u.viewed_places_count,
+                    u.latitude IS NOT NULL AND u.longitude IS NOT NULL,
+                    (
+                        SELECT COALESCE(jsonb_agg(b ORDER BY n), '[]'::jsonb)::text
+                        FROM (
+                            SELECT b, n
+                            FROM jsonb_array_elements($3::jsonb) WITH ORDINALITY AS t(b, n)
+                            ORDER BY n DESC
+                            LIMIT $4
+                        ) AS ring
+                    ),
+                    $5::int,
+                    $6::bool,
+                    $7::bool,
+                    $8::bool
+                FROM users u
+                WHERE u.id = $1
+                ON CONFLICT (user_id) DO UPDATE SET
+                    activity_date = EXCLUDED.activity_date,
+                    viewed_places_count = EXCLUDED.viewed_places_count,
+                    has_geolocation = EXCLUDED.has_geolocation,
+                    -- Последние кнопки из старых и новых
+                    last_buttons = (
+                        SELECT COALESCE(jsonb_agg(b ORDER BY n), '[]'::jsonb)::text
+                        FROM (
+                            SELECT b, n
+                            FROM jsonb_array_elements(COALESCE(l.last_buttons, '[]')::jsonb || $3::jsonb)
+                                WITH ORDINALITY AS t(b, n)
+                            ORDER BY n DESC
+                            LIMIT $4
+                        ) AS ring
+                    ),
+                    total_activities = COALESCE(l.total_activities, 0) + EXCLUDED.total_activities,
+                    filters = EXCLUDED.filters OR l.filters,
+                    categories = EXCLUDED.categories OR l.categories,
+                    wishes = EXCLUDED.wishes OR l.wishes
+                """,
+                [
+                    (user_id, activity_date, json.dumps(buttons), keep, activities, filters, categories, wishes)
+                    for user_id, activity_date, buttons, keep, activities, filters, categories, wishes in logs
+                ],
             )
 
     async def get_random_places(self) -> list[asyncpg.Record]:
-        async with self._pool.acquire() as conn:
+        async with self._acquire() as conn:
             return await conn.fetch(
                 """
                 SELECT id, name, address, description, categories_ya as categories, categories_1, 
@@ -302,7 +605,7 @@ class DbRepo:
             )
 
     async def get_places_data(self, user_id) -> list[asyncpg.Record]:
-        async with self._pool.acquire() as conn:
+        async with self._acquire() as conn:
             res = await conn.fetch(
                 """
                 SELECT p.id,
@@ -328,13 +631,254 @@ class DbRepo:
             )
             return res
 
+    async def get_ranked_places(
+        self,
+        user_id: int,
+        category_ids: list[int],
+        wish_ids: list[int],
+        user_filters: list[str],
+        filter_ids: list[int],
+        bad_names: list[str],
+        limit: int = 400,
+    ) -> list[asyncpg.Record]:
+        """
+        Считает очки мест (300 за первый фильтр, 100 за категорию, 50 за пожелание),
+        фильтрует и балансирует по первому фильтру на стороне БД, возвращает только топ.
+        Отбор по фильтрам идёт по GIN-индексу places.filter_ids; если ни один фильтр пользователя
+        не известен (filter_ids пуст при непустых user_filters), подходящих мест нет.
+        """
+        async with self._acquire() as conn:
+            return await conn.fetch(
+                """
+                WITH scored AS (
+                    SELECT
+                        p.id,
+                        p.name,
+                        p.first_filter,
+                        (CASE WHEN p.first_filter = ANY($4::text[]) THEN 300 ELSE 0 END)
+                        + 100 * (SELECT COUNT(*) FROM unnest(p.category_ids) c WHERE c = ANY($2::int[]))
+                        + 50 * (SELECT COUNT(*) FROM unnest(p.wish_ids) w WHERE w = ANY($3::int[]))
+                        AS total_score
+                    FROM places p
+                    LEFT JOIN users_places up
+                        ON up.place_id = p.id
+                        AND up.user_id = $1
+                    WHERE ((up.viewed = FALSE AND up.favourite = FALSE) OR up.place_id IS NULL)
+                    AND NOT lower(p.name) LIKE ANY($6::text[])
+                    AND (cardinality($4::text[]) = 0 OR p.filter_ids && $5::int[])
+                ),
+                ranked AS (
+                    SELECT
+                        *,
+                        ROW_NUMBER() OVER (ORDER BY total_score DESC, id) AS overall_rn,
+                        ROW_NUMBER() OVER (PARTITION BY first_filter ORDER BY total_score DESC, id) AS filter_rn
+                    FROM scored
+                ),
+                balanced AS (
+                    SELECT *, MIN(overall_rn) OVER (PARTITION BY first_filter) AS filter_order
+                    FROM ranked
+                )
+                SELECT id, name, total_score, first_filter
+                FROM balanced
+                WHERE cardinality($4::text[]) <= 1 OR first_filter = ANY($4::text[])
+                ORDER BY
+                    CASE WHEN cardinality($4::text[]) = 1 THEN overall_rn END,
+                    filter_rn,
+                    CASE
+                        WHEN cardinality($4::text[]) = 0 THEN filter_order
+                        ELSE array_position($4::text[], first_filter)
+                    END
+                LIMIT $7
+                """,
+                user_id,
+                category_ids,
+                wish_ids,
+                user_filters,
+                filter_ids,
+                [f"%{name}%" for name in bad_names],
+                limit,
+            )
+
+    async def get_catalog_version(self) -> int:
+        async with self._acquire() as conn:
+            return await conn.fetchval("SELECT version FROM catalog_version")
+
+    async def get_catalog_places(self) -> list[asyncpg.Record]:
+        async with self._acquire() as conn:
+            return await conn.fetch(
+                """
+                SELECT id, name, latitude, longitude, rating, first_filter, filter_ids, category_ids, wish_ids
+                FROM places
+                ORDER BY id
+                """
+            )
+
+    async def get_places_by_ids(self, place_ids: list[int]) -> list[asyncpg.Record]:
+        async with self._acquire() as conn:
+            return await conn.fetch(
+                """
+                SELECT
+                    id,
+                    name,
+                    address,
+                    description,
+                    categories_ya AS categories,
+                    categories_1,
+                    categories_2,
+                    website,
+                    photo,
+                    rating,
+                    latitude,
+                    longitude
+                FROM places
+                WHERE id = ANY($1::int[])
+                """,
+                place_ids,
+            )
+
+    async def get_excluded_place_ids(self, user_id: int) -> list[int]:
+        """
+        Места, которые не попадают в подборку пользователя (те же условия, что и в get_places_data).
+        """
+        async with self._acquire() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT place_id
+                FROM users_places
+                WHERE user_id = $1
+                AND (viewed IS DISTINCT FROM FALSE OR favourite IS DISTINCT FROM FALSE)
+                """,
+                user_id,
+            )
+            return [row["place_id"] for row in rows]
+
+    async def get_nearby_places(
+        self,
+        user_id: int,
+        latitude: float,
+        longitude: float,
+        radius_m: float,
+        bad_names: list[str],
+        limit: int = 400,
+    ) -> list[asyncpg.Record]:
+        """
+        Ближайшие к точке непросмотренные и не отклонённые места в радиусе radius_m.
+        Отбор и сортировка идут по GiST-индексу places.earth_point.
+        """
+        async with self._acquire() as conn:
+            return await conn.fetch(
+                """
+                SELECT
+                    p.id,
+                    p.name,
+                    p.address,
+                    p.description,
+                    p.categories_ya AS categories,
+                    p.categories_1,
+                    p.categories_2,
+                    p.website,
+                    p.photo,
+                    p.rating,
+                    p.latitude,
+                    p.longitude,
+                    earth_distance(p.earth_point, ll_to_earth($2, $3)) / 1000 AS distance
+                FROM places p
+                WHERE earth_box(ll_to_earth($2, $3), $4) @> p.earth_point
+                AND earth_distance(p.earth_point, ll_to_earth($2, $3)) <= $4
+                AND NOT lower(p.name) LIKE ANY($5::text[])
+                AND NOT EXISTS (
+                    SELECT 1
+                    FROM users_places up
+                    WHERE up.user_id = $1
+                    AND up.place_id = p.id
+                    AND (up.viewed = TRUE OR up.favourite = FALSE)
+                )
+                ORDER BY p.earth_point <-> ll_to_earth($2, $3)
+                LIMIT $6
+                """,
+                user_id,
+                latitude,
+                longitude,
+                radius_m,
+                [f"%{name}%" for name in bad_names],
+                limit,
+            )
+
+    async def sync_places_points(self) -> int:
+        """
+        Дозаполняет earth_point у строк, записанных до появления триггера places_earth_point.
+        """
+        async with self._acquire() as conn:
+            res = await conn.execute(
+                """
+                UPDATE places
+                SET earth_point = CASE
+                    WHEN latitude IS NULL OR longitude IS NULL THEN NULL
+                    ELSE ll_to_earth(latitude::double precision, longitude::double precision)
+                END
+                WHERE earth_point IS DISTINCT FROM CASE
+                    WHEN latitude IS NULL OR longitude IS NULL THEN NULL
+                    ELSE ll_to_earth(latitude::double precision, longitude::double precision)
+                END
+                """
+            )
+            return int(res.split()[-1])
+
+    async def sync_places_tags(self, filters: list[str], categories: list[str], wishes: list[str]) -> int:
+        """
+        Сохраняет справочники (AVAILABLE_FILTERS, CATEGORIES_TYPES, WISHES_TYPES), по которым триггер places_tags
+        раскладывает categories_ya, categories_1 и categories_2 в массивы индексов, и пересчитывает старые строки.
+        Перезаписывает только строки, у которых что-то изменилось.
+        """
+        async with self._acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    """
+                    INSERT INTO place_tag_vocabularies (kind, tags)
+                    VALUES ('filters', $1::text[]), ('categories', $2::text[]), ('wishes', $3::text[])
+                    ON CONFLICT (kind) DO UPDATE SET tags = EXCLUDED.tags
+                    """,
+                    filters,
+                    categories,
+                    wishes,
+                )
+                res = await conn.execute(
+                    """
+                    WITH parsed AS (
+                        SELECT
+                            p.id,
+                            place_first_filter(p.categories_ya) AS first_filter,
+                            place_tag_ids(p.categories_ya, $1::text[]) AS filter_ids,
+                            place_tag_ids(p.categories_1, $2::text[]) AS category_ids,
+                            place_tag_ids(p.categories_2, $3::text[]) AS wish_ids
+                        FROM places p
+                    )
+                    UPDATE places p
+                    SET first_filter = parsed.first_filter,
+                        filter_ids = parsed.filter_ids,
+                        category_ids = parsed.category_ids,
+                        wish_ids = parsed.wish_ids
+                    FROM parsed
+                    WHERE p.id = parsed.id
+                    AND (
+                        p.first_filter IS DISTINCT FROM parsed.first_filter
+                        OR p.filter_ids IS DISTINCT FROM parsed.filter_ids
+                        OR p.category_ids IS DISTINCT FROM parsed.category_ids
+                        OR p.wish_ids IS DISTINCT FROM parsed.wish_ids
+                    )
+                    """,
+                    filters,
+                    categories,
+                    wishes,
+                )
+            return int(res.split()[-1])
+
     async def get_current_viewed_state_and_del(self, user_id: int) -> dict[Any, Any]:
-        async with self._pool.acquire() as conn:
+        async with self._acquire() as conn:
             rows = await conn.fetch(
                 """
-                SELECT places.name, up.viewed
+                SELECT up.place_id, up.viewed
                 FROM users_places AS up
-                LEFT JOIN places ON up.place_id = places.id
                 WHERE up.user_id = $1
                 """,
                 user_id,
@@ -359,10 +903,10 @@ class DbRepo:
             return current_viewed_state
 
     async def get_liked_places(self, user_id: int):
-        async with self._pool.acquire() as conn:
+        async with self._acquire() as conn:
             rows = await conn.fetch(
                 """
-                SELECT p.*
+                SELECT p.*, p.categories_ya AS categories
                 FROM users_places up
                 JOIN places p ON up.place_id = p.id
                 WHERE up.user_id = $1 AND up.favourite = TRUE
@@ -372,10 +916,10 @@ class DbRepo:
             return [row for row in rows]
 
     async def get_disliked_places(self, user_id: int):
-        async with self._pool.acquire() as conn:
+        async with self._acquire() as conn:
             rows = await conn.fetch(
                 """
-                SELECT p.*
+                SELECT p.*, p.categories_ya AS categories
                 FROM users_places up
                 JOIN places p ON up.place_id = p.id
                 WHERE up.user_id = $1 AND up.favourite = FALSE
@@ -384,27 +928,46 @@ class DbRepo:
             )
             return [row for row in rows]
 
-    async def save_user_places_relation(
-        self,
-        user_id: int,
-        place_id: int,
-        viewed: int,
-    ):
-        async with self._pool.acquire() as conn:
-            reset_viewed_time = datetime.now(pytz.utc) + timedelta(days=1)
-            await conn.execute(
-                """
-                INSERT INTO users_places(user_id, place_id, viewed, reset_viewed_time)
-                VALUES ($1, $2, $3, $4)
-                """,
-                user_id,
-                place_id,
-                viewed,
-                reset_viewed_time,
-            )
+    async def save_user_places_relations(self, user_id: int, relations: list[tuple[int, bool]]) -> None:
+        """
+        Массово записывает связи пользователя с местами (place_id, viewed) одной транзакцией:
+        COPY во временную таблицу и один INSERT ... SELECT. Порядок мест сохраняется.
+        Внутри внешней транзакции session() это лишь точка сохранения и ON COMMIT DROP не срабатывает
+        до её конца, поэтому таблица создаётся при необходимости и очищается перед каждой записью.
+        """
+        if not relations:
+            return
+        reset_viewed_time = datetime.now(pytz.utc) + timedelta(days=1)
+        async with self._acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("""
+                    CREATE TEMP TABLE IF NOT EXISTS users_places_staging (
+                        place_id INTEGER,
+                        viewed BOOLEAN,
+                        ord INTEGER
+                    ) ON COMMIT DROP;
+                    TRUNCATE users_places_staging;
+                    """)
+                await conn.copy_records_to_table(
+                    "users_places_staging",
+                    records=[(place_id, viewed, ord) for ord, (place_id, viewed) in enumerate(relations)],
+                    columns=["place_id", "viewed", "ord"],
+                )
+                await conn.execute(
+                    """
+                    INSERT INTO users_places(user_id, place_id, viewed, reset_viewed_time)
+                    SELECT $1, s.place_id, s.viewed, $2
+                    FROM users_places_staging s
+                    JOIN places p ON p.id = s.place_id
+                    ORDER BY s.ord
+                    ON CONFLICT (user_id, place_id) DO NOTHING
+                    """,
+                    user_id,
+                    reset_viewed_time,
+                )
 
     async def get_user_places_data(self, user_id: int) -> list[asyncpg.Record]:
-        async with self._pool.acquire() as conn:
+        async with self._acquire() as conn:
             return await conn.fetch(
                 """
                 WITH up AS (
@@ -420,6 +983,9 @@ class DbRepo:
                     p.address,
                     p.description,
                     p.categories_ya AS categories,
+                    p.categories_1,
+                    p.categories_2,
+                    p.website,
                     p.photo,
                     p.rating,
                     p.latitude,
@@ -431,57 +997,38 @@ class DbRepo:
                 user_id,
             )
 
-    async def mark_place_as_viewed(self, user_id: int, place_name: str) -> None:
-        async with self._pool.acquire() as conn:
-            await conn.execute(
-                """
-                UPDATE users_places AS up
-                SET viewed = TRUE
-                FROM places
-                WHERE up.place_id = places.id
-                AND places.name = $1
-                AND up.user_id = $2
-                """,
-                place_name,
-                user_id,
-            )
-
-    async def mark_place_as_liked(self, user_id: int, place_name: str, place_address: str) -> None:
-        async with self._pool.acquire() as conn:
-            await conn.execute(
-                """
-                    UPDATE users_places AS up
-                    SET favourite = TRUE
-                    FROM places
-                    WHERE up.place_id = places.id
-                    AND places.name = $1
-                    AND up.user_id = $2
-                    AND places.address = $3
-                    """,
-                place_name,
-                user_id,
-                place_address,
-            )
-
-    async def mark_place_as_disliked(self, user_id: int, place_name: str, place_address: str) -> None:
-        async with self._pool.acquire() as conn:
+    async def apply_user_places_interactions(
+        self, interactions: list[tuple[int, int, Optional[bool], Optional[bool]]]
+    ) -> None:
+        """
+        Одним запросом применяет пачку (user_id, place_id, viewed, favourite) к users_places.
+        None в viewed и favourite означает «не менять». Места из «Ближайших» могут не входить
+        в подборку — для них связь создаётся.
+        """
+        if not interactions:
+            return
+        user_ids, place_ids, viewed, favourite = map(list, zip(*interactions))
+        async with self._acquire() as conn:
             await conn.execute(
                 """
-                UPDATE users_places AS up
-                SET favourite = FALSE
-                FROM places
-                WHERE up.place_id = places.id
-                AND places.name = $1
-                AND up.user_id = $2
-                AND places.address = $3
+                INSERT INTO users_places AS up (user_id, place_id, viewed, reset_viewed_time, favourite)
+                SELECT a.user_id, a.place_id, a.viewed IS TRUE, $5, a.favourite
+                FROM unnest($1::bigint[], $2::int[], $3::bool[], $4::bool[]) AS a(user_id, place_id, viewed, favourite)
+                JOIN users u ON u.id = a.user_id
+                JOIN places p ON p.id = a.place_id
+                ON CONFLICT (user_id, place_id) DO UPDATE SET
+                    viewed = up.viewed OR EXCLUDED.viewed,
+                    favourite = COALESCE(EXCLUDED.favourite, up.favourite)
                 """,
-                place_name,
-                user_id,
-                place_address,
+                user_ids,
+                place_ids,
+                viewed,
+                favourite,
+                datetime.now(pytz.utc) + timedelta(days=1),
             )
 
     async def delete_liked_disliked(self, user_id: int, place_name: str) -> None:
-        async with self._pool.acquire() as conn:
+        async with self._acquire() as conn:
             await conn.execute(
                 """
                 UPDATE users_places AS up
@@ -496,7 +1043,7 @@ class DbRepo:
             )
 
     async def reset_viewed(self, user_id: int) -> None:
-        async with self._pool.acquire() as conn:
+        async with self._acquire() as conn:
             await conn.execute(
                 """
                 UPDATE users_places 
@@ -510,11 +1057,11 @@ class DbRepo:
         """
         Меняет значение столбца viewed на False во всех связях пользователей с местами.
         """
-        async with self._pool.acquire() as conn:
+        async with self._acquire() as conn:
             await conn.execute("UPDATE users_places SET viewed = FALSE")
 
     async def get_active_today_users(self) -> list[asyncpg.Record]:
-        async with self._pool.acquire() as conn:
+        async with self._acquire() as conn:
             return await conn.fetch(
                 """
                 SELECT user_id, activity_date
@@ -526,15 +1073,50 @@ class DbRepo:
             )
 
     async def delete_user(self, user_id: int) -> None:
-        async with self._pool.acquire() as conn:
+        async with self._acquire() as conn:
             await conn.execute("DELETE FROM users WHERE id = $1", user_id)
 
+    async def get_scheduler_jobs(self) -> list[asyncpg.Record]:
+        async with self._acquire() as conn:
+            return await conn.fetch("SELECT id, job_state FROM apscheduler_jobs ORDER BY next_run_time")
+
+    async def save_scheduler_jobs(
+        self, upserts: list[tuple[str, Optional[float], bytes]], deletes: list[str], clear: bool = False
+    ) -> None:
+        """
+        Одной транзакцией применяет изменения задач планировщика: clear удаляет все задачи до остальных изменений,
+        upserts — записи (id, next_run_time, job_state), deletes — id удалённых задач.
+        """
+        async with self._acquire() as conn:
+            async with conn.transaction():
+                if clear:
+                    await conn.execute("DELETE FROM apscheduler_jobs")
+                if deletes:
+                    await conn.execute("DELETE FROM apscheduler_jobs WHERE id = ANY($1::text[])", deletes)
+                if upserts:
+                    ids, next_run_times, states = zip(*upserts)
+                    await conn.execute(
+                        """
+                        INSERT INTO apscheduler_jobs (id, next_run_time, job_state)
+                        SELECT * FROM unnest($1::text[], $2::float8[], $3::bytea[])
+                        ON CONFLICT (id) DO UPDATE
+                        SET next_run_time = EXCLUDED.next_run_time, job_state = EXCLUDED.job_state
+                        """,
+                        list(ids),
+                        list(next_run_times),
+                        list(states),
+                    )
+
+    async def delete_users(self, user_ids: list[int]) -> None:
+        async with self._acquire() as conn:
+            await conn.execute("DELETE FROM users WHERE id = ANY($1::bigint[])", user_ids)
+
     async def delete_place(self, place_id: int) -> None:
-        async with self._pool.acquire() as conn:
+        async with self._acquire() as conn:
             await conn.execute("DELETE FROM places WHERE id = $1", place_id)
 
     async def get_deleted_stats(self) -> list[asyncpg.Record]:
-        async with self._pool.acquire() as conn:
+        async with self._acquire() as conn:
             return await conn.fetch(
                 """
                 SELECT viewed_places_count, has_geolocation, total_activities, filters, categories, wishes
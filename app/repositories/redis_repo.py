@@ -1,27 +1,62 @@
 import logging
-from typing import Any, Optional
+import time
+from typing import Any, AsyncIterator, Optional
 
 from redis.asyncio import Redis
 
 logger = logging.getLogger(__name__)
 
+# KEYS[1] — хэш сессии, KEYS[2] — список подборки; ARGV[1] — поле курсора, ARGV[2] — шаг, ARGV[3] — префикс карточек.
+# Возвращает {статус, индекс, элемент подборки, карточка}; статусы: ok, start, end, empty.
+_MOVE_CURSOR_LUA = """
+local count = redis.call('LLEN', KEYS[2])
+if count == 0 then
+    return {'empty', 0, false, false}
+end
+local idx = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '0')
+local target = idx + tonumber(ARGV[2])
+if target < 0 then
+    return {'start', idx, false, false}
+end
+if target >= count then
+    return {'end', idx, false, false}
+end
+redis.call('HSET', KEYS[1], ARGV[1], target)
+local item = redis.call('LINDEX', KEYS[2], target)
+local place_id = string.match(item, '^%[%s*(%d+)')
+local card = redis.call('GET', ARGV[3] .. place_id)
+return {'ok', target, item, card}
+"""
+
+# KEYS[1] — сортированное множество; ARGV[1] — максимальный score, ARGV[2] — сколько элементов забрать.
+# Атомарно извлекает элементы с score не больше ARGV[1], начиная с меньших.
+_POP_BY_SCORE_LUA = """
+local items = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #items > 0 then
+    redis.call('ZREM', KEYS[1], unpack(items))
+end
+return items
+"""
+
 
 class RedisRepo:
     def __init__(self, redis: Redis):
         self._r = redis
+        self._move_cursor = self._r.register_script(_MOVE_CURSOR_LUA)
+        self._pop_by_score = self._r.register_script(_POP_BY_SCORE_LUA)
 
     async def close(self) -> None:
         await self._r.close()
 
-    async def set(self, key: Any, val: Any) -> None:
-        await self._r.set(key, val)
+    async def ping(self) -> None:
+        await self._r.ping()
+
+    async def set(self, key: Any, val: Any, ex: Optional[int] = None) -> None:
+        await self._r.set(key, val, ex=ex)
 
     async def get(self, key: Any) -> Optional[Any]:
         return await self._r.get(key)
 
-    async def get_keys(self, pattern: str = "*") -> list[Any]:
-        return await self._r.keys(pattern)
-
     async def set_list(self, key: Any, val: list[Any]) -> None:
         await self._r.delete(key)
         await self._r.rpush(key, *val)
@@ -31,3 +66,146 @@ class RedisRepo:
 
     async def get_list(self, key: Any, start_idx: int, end_idx: int) -> list[Any]:
         return await self._r.lrange(key, start_idx, end_idx)
+
+    async def get_list_item(self, key: Any, idx: int) -> Optional[Any]:
+        return await self._r.lindex(key, idx)
+
+    async def get_many(self, keys: list[Any]) -> list[Optional[Any]]:
+        if not keys:
+            return []
+        return await self._r.mget(keys)
+
+    async def set_many(self, mapping: dict[Any, Any], ex: Optional[int] = None) -> None:
+        async with self._r.pipeline(transaction=False) as pipe:
+            for key, val in mapping.items():
+                pipe.set(key, val, ex=ex)
+            await pipe.execute()
+
+    async def set_list_with_values(self, key: Any, items: list[Any], mapping: dict[Any, Any], ex: int) -> None:
+        """
+        Одним пайплайном заменяет список key и записывает с TTL те связанные с ним ключи mapping,
+        которых ещё нет (уже сохранённые не перезаписываются и доживают свой TTL).
+        """
+        async with self._r.pipeline(transaction=False) as pipe:
+            for k, val in mapping.items():
+                pipe.set(k, val, ex=ex, nx=True)
+            pipe.delete(key)
+            if items:
+                pipe.rpush(key, *items)
+            await pipe.execute()
+
+    async def move_list_cursor(
+        self, hash_key: Any, list_key: Any, cursor_field: str, step: int, value_prefix: str
+    ) -> tuple[str, int, Optional[Any], Optional[Any]]:
+        """
+        Атомарно сдвигает курсор cursor_field в хэше hash_key по списку list_key на step с проверкой границ
+        и возвращает новый элемент списка вместе со значением ключа value_prefix + id из этого элемента.
+        """
+        status, idx, item, value = await self._move_cursor(
+            keys=[hash_key, list_key], args=[cursor_field, step, value_prefix]
+        )
+        return status, idx, item, value
+
+    async def scan_keys(self, pattern: str, count: int = 1000) -> AsyncIterator[Any]:
+        """
+        Ключи по шаблону через SCAN, без блокирующего KEYS.
+        """
+        async for key in self._r.scan_iter(match=pattern, count=count):
+            yield key
+
+    async def exists(self, key: Any) -> bool:
+        return await self._r.exists(key) > 0
+
+    async def replace_hash(self, key: Any, mapping: dict[Any, Any]) -> None:
+        async with self._r.pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            if mapping:
+                pipe.hset(key, mapping=mapping)
+            await pipe.execute()
+
+    async def set_hash_fields(self, key: Any, mapping: dict[Any, Any]) -> None:
+        if mapping:
+            await self._r.hset(key, mapping=mapping)
+
+    async def delete_hash_field(self, key: Any, field: Any) -> None:
+        await self._r.hdel(key, field)
+
+    async def get_hash(self, key: Any) -> dict[Any, Any]:
+        return await self._r.hgetall(key)
+
+    async def get_hash_fields(self, key: Any, fields: list[Any]) -> list[Optional[Any]]:
+        return await self._r.hmget(key, fields)
+
+    async def delete_keys(self, *keys: Any) -> None:
+        if keys:
+            await self._r.delete(*keys)
+
+    async def add_to_set(self, key: Any, *members: Any) -> None:
+        if members:
+            await self._r.sadd(key, *members)
+
+    async def remove_from_set(self, key: Any, *members: Any) -> None:
+        if members:
+            await self._r.srem(key, *members)
+
+    async def get_set_members(self, key: Any) -> list[Any]:
+        return list(await self._r.smembers(key))
+
+    async def add_scored(self, key: Any, mapping: dict[Any, float]) -> None:
+        if mapping:
+            await self._r.zadd(key, mapping)
+
+    async def pop_by_score(self, key: Any, max_score: float, limit: int) -> list[Any]:
+        return await self._pop_by_score(keys=[key], args=[max_score, limit])
+
+    async def get_zset_members(self, key: Any) -> list[Any]:
+        return await self._r.zrange(key, 0, -1)
+
+    async def add_scored_and_incr(
+        self, zset_key: Any, member: Any, score: float, hash_key: Any, field: Any, set_key: Any = None
+    ) -> None:
+        """
+        Одной транзакцией добавляет member в сортированное множество zset_key (и в множество set_key, если задано)
+        и увеличивает счётчик field в хэше hash_key.
+        """
+        async with self._r.pipeline(transaction=True) as pipe:
+            pipe.zadd(zset_key, {member: score})
+            if set_key is not None:
+                pipe.sadd(set_key, member)
+            pipe.hincrby(hash_key, field, 1)
+            await pipe.execute()
+
+    async def set_hash_fields_and_trim_zset(
+        self, hash_key: Any, mapping: dict[Any, Any], zset_key: Any, max_score: float
+    ) -> None:
+        """
+        Одной транзакцией записывает поля хэша и удаляет из zset_key элементы с score не больше max_score.
+        """
+        async with self._r.pipeline(transaction=True) as pipe:
+            pipe.hset(hash_key, mapping=mapping)
+            pipe.zremrangebyscore(zset_key, "-inf", max_score)
+            await pipe.execute()
+
+    async def get_and_touch(self, key: Any, lru_key: Any) -> Optional[Any]:
+        """
+        Читает ключ и обновляет время последнего обращения к нему в индексе lru_key.
+        """
+        async with self._r.pipeline(transaction=False) as pipe:
+            pipe.get(key)
+            pipe.zadd(lru_key, {key: time.time()}, xx=True)
+            val, _ = await pipe.execute()
+        return val
+
+    async def set_with_lru(self, key: Any, val: Any, ttl: int, lru_key: Any, max_keys: int) -> None:
+        """
+        Записывает ключ с TTL и вытесняет давно не читанные ключи, если их больше max_keys.
+        """
+        async with self._r.pipeline(transaction=False) as pipe:
+            pipe.set(key, val, ex=ttl)
+            pipe.zadd(lru_key, {key: time.time()})
+            pipe.zcard(lru_key)
+            _, _, size = await pipe.execute()
+        if size > max_keys:
+            evicted = await self._r.zpopmin(lru_key, size - max_keys)
+            if evicted:
+                await self._r.delete(*[k for k, _ in evicted])
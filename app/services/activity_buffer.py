@@ -0,0 +1,100 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional
+
+import pytz
+
+from app.repositories.db_repo import DbRepo
+
+logger = logging.getLogger(__name__)
+
+_CONFIRM_BUTTONS = ("confirm_filters", "confirm_categories", "confirm_wishes")
+
+
+class _UserActivity:
+    """
+    Накопленные с последней записи в БД действия одного пользователя.
+    """
+
+    __slots__ = ("activity_date", "buttons", "ends_with_button", "count", "confirmed")
+
+    def __init__(self) -> None:
+        self.activity_date: Optional[datetime] = None
+        self.buttons: list[str] = []
+        self.ends_with_button = False
+        self.count = 0
+        self.confirmed = dict.fromkeys(_CONFIRM_BUTTONS, False)
+
+    def add(self, last_button: Optional[str]) -> None:
+        self.activity_date = datetime.now(pytz.utc)
+        self.count += 1
+        self.ends_with_button = bool(last_button)
+        if last_button:
+            # В логах хранятся максимум три последние кнопки, больше копить незачем
+            self.buttons = (self.buttons + [last_button])[-3:]
+            if last_button in self.confirmed:
+                self.confirmed[last_button] = True
+
+
+class ActivityBuffer:
+    """
+    Копит активность пользователей в памяти и записывает её в logs одной пачкой:
+    по таймеру (flush из планировщика) или когда накопилось max_events событий.
+    """
+
+    def __init__(self, repo: DbRepo, max_events: int = 500) -> None:
+        self._repo = repo
+        self._max_events = max_events
+        self._pending: dict[int, _UserActivity] = {}
+        self._events = 0
+        self._lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def add(self, user_id: int, last_button: Optional[str] = None) -> None:
+        self._pending.setdefault(user_id, _UserActivity()).add(last_button)
+        self._events += 1
+        if self._events >= self._max_events and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self.flush())
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            self._events = 0
+
+            logs = [
+                (
+                    user_id,
+                    activity.activity_date,
+                    activity.buttons,
+                    # Без кнопки в последнем действии история сокращается до двух кнопок
+                    3 if activity.ends_with_button else 2,
+                    activity.count,
+                    *activity.confirmed.values(),
+                )
+                for user_id, activity in pending.items()
+            ]
+            try:
+                await self._repo.upsert_user_logs(logs)
+                logger.info(f"[ActivityBuffer] Записана активность {len(logs)} пользователей")
+            except Exception as e:
+                logger.error(f"Error flushing user activity: {e}")
+                # Возвращаем события в буфер, чтобы записать их при следующей попытке
+                for user_id, activity in pending.items():
+                    if user_id in self._pending:
+                        self._merge(activity, self._pending[user_id])
+                    self._pending[user_id] = activity
+
+    @staticmethod
+    def _merge(older: _UserActivity, newer: _UserActivity) -> None:
+        """
+        Дописывает в older более новые события newer.
+        """
+        older.activity_date = newer.activity_date
+        older.buttons = (older.buttons + newer.buttons)[-3:]
+        older.ends_with_button = newer.ends_with_button
+        older.count += newer.count
+        for button, confirmed in newer.confirmed.items():
+            older.confirmed[button] = older.confirmed[button] or confirmed
@@ -1,4 +1,5 @@
 import logging
+from typing import Optional
 
 from app.services.db_service import DbService
 from app.services.redis_service import RedisService
@@ -26,20 +27,19 @@ class Coordinator:
         logger.info(f"New user added {user_id=}, {daily_count + 1=}")
 
     async def like_place(self, user_id: int):
-        user_data = await self._redis_service.get_user_data(user_id)
-        current_index = user_data.get("current_place_index", 0)
-        place = user_data.get("places", [])[current_index]
-        place_name = place["name"]
-        place_address = place["address"]
-        await self._db_service.mark_place_as_liked(user_id, place_name, place_address)
+        place_id = await self._get_current_place_id(user_id)
+        if place_id is not None:
+            await self._db_service.mark_place_as_liked(user_id, place_id)
 
     async def dislike_place(self, user_id: int):
-        user_data = await self._redis_service.get_user_data(user_id)
-        current_index = user_data.get("current_place_index", 0)
-        place = user_data.get("places", [])[current_index]
-        place_name = place["name"]
-        place_address = place["address"]
-        await self._db_service.mark_place_as_disliked(user_id, place_name,place_address)
+        place_id = await self._get_current_place_id(user_id)
+        if place_id is not None:
+            await self._db_service.mark_place_as_disliked(user_id, place_id)
+
+    async def _get_current_place_id(self, user_id: int) -> Optional[int]:
+        user_data = await self._redis_service.get_user_data(user_id, "current_place_index")
+        item = await self._redis_service.get_user_feed_item(user_id, user_data.get("current_place_index", 0))
+        return item[0] if item else None
 
     async def show_liked_disliked(self, user_id: int, start_idx: int, end_idx: int, liked: bool = True) -> str:
         places = await self._redis_service.get_liked_disliked(user_id, start_idx, end_idx, liked)
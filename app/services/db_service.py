@@ -1,22 +1,62 @@
+import hashlib
 import json
 import logging
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from random import randrange
-from typing import Any, Optional
+from typing import Any, AsyncIterator, Optional
 
+import numpy as np
 import pytz
 from asyncpg import Record
 
 from app.bot.constants import Constants
+from app.bot.msgs_text import AVAILABLE_FILTERS, MsgsText
+from app.core import geo
 from app.core.utils import async_log_decorator
 from app.repositories.db_repo import DbRepo
+from app.services.activity_buffer import ActivityBuffer
+from app.services.interaction_buffer import InteractionBuffer
+from app.services.place_catalog import PlaceCatalog
+from app.services.redis_service import RedisService
 
 logger = logging.getLogger(__name__)
 
 
 class DbService:
-    def __init__(self, repo: DbRepo) -> None:
+    def __init__(
+        self,
+        repo: DbRepo,
+        ranking: str = "catalog",
+        catalog: Optional[PlaceCatalog] = None,
+        nearby_radius_km: float = 50,
+        redis_service: Optional[RedisService] = None,
+        ranking_cache_ttl: int = 3600,
+        ranking_cache_max_keys: int = 1000,
+        ranking_cache_depth: int = 2000,
+        place_card_ttl: int = 86400,
+        activity_flush_max_events: int = 500,
+        interaction_flush_max_events: int = 500,
+        user_profile_ttl: int = 3600,
+    ) -> None:
         self._repo = repo
+        self._nearby_radius_km = nearby_radius_km
+        self._redis_service = redis_service
+        self._ranking_cache_ttl = ranking_cache_ttl
+        self._ranking_cache_max_keys = ranking_cache_max_keys
+        # Сколько мест хранить в общей подборке, чтобы после вычитания просмотренных осталось 400
+        self._ranking_cache_depth = ranking_cache_depth
+        self._place_card_ttl = place_card_ttl
+        self._activity = ActivityBuffer(repo, activity_flush_max_events)
+        self._interactions = InteractionBuffer(repo, interaction_flush_max_events)
+        self._user_profile_ttl = user_profile_ttl
+        # Профили пользователей, прочитанные за время текущего апдейта (см. request_scope)
+        self._profiles: ContextVar[Optional[dict[int, Optional[dict]]]] = ContextVar("user_profiles", default=None)
         self.user_count = 0
+        # "catalog" — ранжирование по каталогу в памяти, "sql" — ранжирование в БД,
+        # "python" — прежний расчёт в процессе (для сверки результатов)
+        self._ranking = ranking
+        self._catalog = catalog
 
     async def init_db(self, user, password, database, host, port, min_size=10, max_size=30) -> None:
         await self._repo.init(user, password, database, host, port, min_size, max_size)
@@ -24,9 +64,59 @@ class DbService:
     async def close_db(self) -> None:
         await self._repo.close()
 
+    async def ping(self) -> None:
+        await self._repo.ping()
+
+    @asynccontextmanager
+    async def request_scope(self) -> AsyncIterator[None]:
+        """
+        Общий для блока (обычно — обработки одного апдейта) кэш профилей пользователей.
+        Соединение с БД при этом не одалживается: обработчик ждёт ответов Telegram и лимитов отправки.
+        """
+        token = self._profiles.set({}) if self._profiles.get() is None else None
+        try:
+            yield
+        finally:
+            if token is not None:
+                self._profiles.reset(token)
+
+    @asynccontextmanager
+    async def session(self, transaction: bool = False) -> AsyncIterator[None]:
+        """
+        Одно соединение из пула (при transaction=True — одна транзакция) на все запросы внутри блока.
+        Открывается только вокруг работы с БД, без запросов к Telegram внутри.
+        """
+        async with self.request_scope():
+            async with self._repo.session(transaction):
+                yield
+
     async def create_tables(self) -> None:
         await self._repo.create_tables()
 
+    async def sync_places(self) -> None:
+        """
+        Обновляет справочники категорий в БД и дозаполняет производные колонки мест (индексы справочников
+        и точку для поиска ближайших). Новые и изменённые места заполняются триггерами на places,
+        поэтому вызывается только при старте.
+        """
+        updated = await self._repo.sync_places_tags(
+            AVAILABLE_FILTERS, MsgsText.CATEGORIES_TYPES.value, MsgsText.WISHES_TYPES.value
+        )
+        logger.info(f"[sync_places] Обновлены категории у {updated} мест")
+        updated = await self._repo.sync_places_points()
+        logger.info(f"[sync_places] Обновлены координаты у {updated} мест")
+
+    async def load_place_catalog(self) -> None:
+        if self._catalog is not None:
+            await self._catalog.load()
+
+    async def refresh_place_catalog(self) -> None:
+        if self._catalog is not None:
+            try:
+                await self._catalog.refresh()
+            except Exception as e:
+                logger.error(f"Error while refreshing place catalog: {e}")
+
     async def get_user_stats(self, user_id: int) -> Optional[dict[str, Any]]:
         row = await self._repo.get_user_stats(user_id)
         return (
@@ -41,16 +131,34 @@ class DbService:
             else None
         )
 
-    async def get_users_ids(self) -> list[int]:
-        rows = await self._repo.get_users_ids()
-        return [row["id"] for row in rows]
+    async def iter_users_ids(self, after_id: int = 0, chunk_size: int = 1000) -> AsyncIterator[list[int]]:
+        """
+        Отдаёт id пользователей больше after_id по возрастанию пачками по chunk_size.
+        Каждая пачка читается отдельным коротким запросом, соединение между пачками не удерживается.
+        """
+        while True:
+            rows = await self._repo.get_users_ids_after(after_id, chunk_size)
+            if not rows:
+                return
+            chunk = [row["id"] for row in rows]
+            yield chunk
+            if len(chunk) < chunk_size:
+                return
+            after_id = chunk[-1]
 
     async def get_users_count(self) -> int:
         return await self._repo.get_users_count()
 
+    @property
+    def catalog_version(self) -> Optional[int]:
+        return self._catalog.version if self._catalog is not None else None
+
     async def get_categories_and_wishes(self, place: dict[Any, Any]) -> tuple[str, str]:
-        name, address = place.get("name"), place.get("address")
-        row = await self._repo.get_categories_and_wishes(name, address)
+        if "categories_1" in place:
+            # Карточка уже дополнена категориями при сборке подборки
+            row = place
+        else:
+            row = await self._repo.get_categories_and_wishes(place.get("name"), place.get("address"))
         categories_text = "Не указаны"
         wishes_text = "Не указаны"
         website = ""
@@ -65,24 +173,35 @@ class DbService:
 
     @async_log_decorator(logger)
     async def get_user(self, user_id: int) -> Optional[dict]:
-        try:
-            user = await self._repo.get_user(user_id)
+        """
+        Профиль пользователя: сначала из кэша текущего апдейта, затем из Redis, затем из БД.
+        """
+        memo = self._profiles.get()
+        if memo is not None and user_id in memo:
+            return self._copy_profile(memo[user_id])
+
+        profile = await self._get_cached_profile(user_id)
+        if profile is None:
+            try:
+                user = await self._repo.get_user(user_id)
+            except Exception as e:
+                logger.error(f"Database error in get_user: {e}")
+                return None
             if user:
                 # Храним фильтры как строку через запятую
-                filters = user[3].split(",") if user[3] else []
-
-                return {
-                    "id": user[0],
-                    "categories": user[1].split(",") if user[1] else [],
-                    "wishes": user[2].split(",") if user[2] else [],
-                    "filters": filters,
-                    "latitude": user[4],
-                    "longitude": user[5],
-                }
-            return None
-        except Exception as e:
-            logger.error(f"Database error in get_user: {e}")
-            return None
+                profile = self._make_profile(
+                    user[0],
+                    user[1].split(",") if user[1] else [],
+                    user[2].split(",") if user[2] else [],
+                    user[3].split(",") if user[3] else [],
+                    user[4],
+                    user[5],
+                )
+                await self._cache_profile(user_id, profile)
+
+        if memo is not None:
+            memo[user_id] = profile
+        return self._copy_profile(profile)
 
     @async_log_decorator(logger)
     async def create_or_update_user(
@@ -100,7 +219,7 @@ class DbService:
         wishes_str = ",".join(wishes) if wishes else ""
 
         # Проверяем, существует ли пользователь
-        existing_user = await self._repo.get_user(user_id)
+        existing_user = await self.get_user(user_id)
 
         if existing_user:
             # Обновляем существующего пользователя
@@ -109,79 +228,67 @@ class DbService:
             # Создаем нового пользователя
             await self._repo.create_user(user_id, categories_str, wishes_str, filters_str, latitude, longitude)
 
+        # Обновляем кэш профиля тем, что записали в БД
+        profile = self._make_profile(
+            user_id,
+            categories_str.split(",") if categories_str else [],
+            wishes_str.split(",") if wishes_str else [],
+            filters_str.split(",") if filters_str else [],
+            latitude,
+            longitude,
+        )
+        memo = self._profiles.get()
+        if memo is not None:
+            memo[user_id] = profile
+        await self._cache_profile(user_id, profile)
+
+    @staticmethod
+    def _make_profile(user_id, categories, wishes, filters, latitude, longitude) -> dict[str, Any]:
+        return {
+            "id": user_id,
+            "categories": categories,
+            "wishes": wishes,
+            "filters": filters,
+            "latitude": latitude,
+            "longitude": longitude,
+        }
+
+    @staticmethod
+    def _copy_profile(profile: Optional[dict]) -> Optional[dict]:
+        # Вызывающий код может менять списки профиля, кэш от этого страдать не должен
+        if profile is None:
+            return None
+        return {k: list(v) if isinstance(v, list) else v for k, v in profile.items()}
+
+    async def _get_cached_profile(self, user_id: int) -> Optional[dict]:
+        if self._redis_service is None:
+            return None
+        try:
+            return await self._redis_service.get_user_profile(user_id)
+        except Exception as e:
+            logger.error(f"Error reading cached profile {user_id=}: {e}")
+            return None
+
+    async def _cache_profile(self, user_id: int, profile: dict) -> None:
+        if self._redis_service is None:
+            return
+        try:
+            await self._redis_service.set_user_profile(user_id, profile, self._user_profile_ttl)
+        except Exception as e:
+            logger.error(f"Error caching profile {user_id=}: {e}")
+
     async def update_user_activity(self, user_id: int, last_button: str = None):
         """
-        Обновляет время последней активности пользователя и сохраняет статистику в логи
+        Обновляет время последней активности пользователя и сохраняет статистику в логи.
+        Запись в БД отложенная: события копятся в буфере и пишутся пачкой в flush_user_activity.
         """
+        self._activity.add(user_id, last_button)
 
-        try:
-            # Получаем текущие данные пользователя
-            user = await self.get_user(user_id)
-            has_geolocation = user is not None and user["latitude"] is not None and user["longitude"] is not None
-
-            # Получаем количество просмотренных мест
-            viewed_places_count = await self._repo.get_viewed_places_count(user_id)
-
-            # Проверяем, существует ли уже запись в логах для этого пользователя
-            log_exists = await self._repo.log_exists(user_id)
-
-            if log_exists:
-                # Если запись существует, получаем текущие last_buttons
-                result = tuple(await self._repo.get_last_buttons(user_id))
-                current_last_buttons = []
-                total_activities = result[1] + 1 if result[1] else 1
-
-                has_filt_cat_wish = await self._repo.get_filt_cat_wish(user_id)
-                filters = True if last_button=="confirm_filters" else has_filt_cat_wish[0]
-                categories = True if last_button=="confirm_categories" else has_filt_cat_wish[1]
-                wishes = True if last_button=="confirm_wishes" else has_filt_cat_wish[2]
-
-                if result[0]:
-                    try:
-                        current_last_buttons = json.loads(result[0])
-                        # Ограничиваем историю до 2 предыдущих кнопок
-                        if len(current_last_buttons) >= 2:
-                            current_last_buttons = current_last_buttons[-2:]
-                    except json.JSONDecodeError:
-                        current_last_buttons = []
-
-                # Добавляем новую кнопку, если она указана
-                if last_button:
-                    current_last_buttons.append(last_button)
-                    # Ограничиваем историю до 3 кнопок
-                    if len(current_last_buttons) > 3:
-                        current_last_buttons = current_last_buttons[-3:]
-
-                # Обновляем существующую запись
-                await self._repo.update_logs(
-                    user_id,
-                    viewed_places_count,
-                    has_geolocation,
-                    json.dumps(current_last_buttons),
-                    total_activities,
-                    filters,
-                    categories,
-                    wishes,
-                )
-
-            else:
-                # Создаем новую запись
-                last_buttons = [last_button] if last_button else []
-                filters = True if last_button=="confirm_filters" else False
-                categories = True if last_button=="confirm_categories" else False
-                wishes = True if last_button=="confirm_wishes" else False
-                await self._repo.create_user_log(
-                    user_id,
-                    viewed_places_count,
-                    has_geolocation,
-                    json.dumps(last_buttons),
-                    filters,
-                    categories,
-                    wishes,
-                )
+    async def flush_user_activity(self) -> None:
+        await self._activity.flush()
 
-        except Exception as e:
-            logger.error(f"Error updating user activity: {e}")
+    async def flush_place_interactions(self) -> None:
+        await self._interactions.flush()
 
     async def get_user_filters(self, user_id: int) -> list[Any]:
         user = await self.get_user(user_id)
@@ -216,6 +323,108 @@ class DbService:
             self._filter_bad_places(places)
             return places
 
+        if self._ranking == "python":
+            balanced_top = await self._rank_places_python(categories, wishes, user_id, user_filters)
+        else:
+            # Порядок фильтров не должен влиять на результат, иначе общий кэш подборок не сработает
+            user_filters = sorted(user_filters or [])
+            category_ids = self._tags_to_ids(categories, MsgsText.CATEGORIES_TYPES.value)
+            wish_ids = self._tags_to_ids(wishes, MsgsText.WISHES_TYPES.value)
+            filter_ids = self._tags_to_ids(user_filters, AVAILABLE_FILTERS)
+
+            balanced_top = await self._get_shared_ranking(user_id, category_ids, wish_ids, user_filters, filter_ids)
+            if balanced_top is None:
+                balanced_top = await self._rank_places(user_id, category_ids, wish_ids, user_filters, filter_ids)
+
+        # --- Логирование распределения ---
+        dist = {}
+        for p in balanced_top:
+            dist[p["first_filter"]] = dist.get(p["first_filter"], 0) + 1
+        dist_str = ", ".join([f"{filt}: {count}" for filt, count in dist.items()])
+        logger.info(f"[get_all_places] Итоговое распределение фильтров: {dist_str}")
+
+        logger.info(f"[get_all_places] Отобрано топ-{len(balanced_top)} мест")
+        return balanced_top
+
+    async def _rank_places(
+        self,
+        user_id: Optional[int],
+        category_ids: list[int],
+        wish_ids: list[int],
+        user_filters: list[str],
+        filter_ids: list[int],
+        limit: int = 400,
+    ) -> list[dict[Any, Any]]:
+        """
+        Ранжирует места каталогом в памяти или запросом в БД. Без user_id — без учёта просмотренных мест.
+        """
+        if self._ranking == "catalog" and self._catalog is not None and self._catalog.loaded:
+            excluded_ids = await self._repo.get_excluded_place_ids(user_id) if user_id is not None else None
+            return self._catalog.rank(category_ids, wish_ids, user_filters, filter_ids, excluded_ids, limit)
+        return [
+            dict(row)
+            for row in await self._repo.get_ranked_places(
+                user_id,
+                category_ids,
+                wish_ids,
+                user_filters,
+                filter_ids,
+                list(Constants.BAD_PLACE_NAMES.value),
+                limit,
+            )
+        ]
+
+    async def _get_shared_ranking(
+        self,
+        user_id: int,
+        category_ids: list[int],
+        wish_ids: list[int],
+        user_filters: list[str],
+        filter_ids: list[int],
+    ) -> Optional[list[dict[Any, Any]]]:
+        """
+        Общая для одинаковых предпочтений подборка из Redis, из которой вычитаются места пользователя.
+        Возвращает None, если кэш недоступен или после вычитания мест не хватает.
+        """
+        if self._redis_service is None:
+            return None
+        try:
+            if self._catalog is not None and self._catalog.loaded:
+                version = self._catalog.version
+            else:
+                version = await self._repo.get_catalog_version()
+            key = hashlib.sha1(
+                json.dumps([user_filters, category_ids, wish_ids, version], ensure_ascii=False).encode()
+            ).hexdigest()
+
+            ranking = await self._redis_service.get_ranking(key)
+            if ranking is None:
+                places = await self._rank_places(
+                    None, category_ids, wish_ids, user_filters, filter_ids, self._ranking_cache_depth
+                )
+                ranking = [[place["id"], place["first_filter"]] for place in places]
+                await self._redis_service.set_ranking(
+                    key, ranking, self._ranking_cache_ttl, self._ranking_cache_max_keys
+                )
+            else:
+                logger.info(f"[get_all_places] Подборка {key} взята из кэша")
+
+            excluded_ids = set(await self._repo.get_excluded_place_ids(user_id))
+            top = [{"id": pid, "first_filter": filt} for pid, filt in ranking if pid not in excluded_ids][:400]
+            if len(top) < 400 and len(ranking) >= self._ranking_cache_depth:
+                return None
+            return top
+        except Exception as e:
+            logger.error(f"Error while getting shared ranking: {e}")
+            return None
+
+    async def _rank_places_python(
+        self,
+        categories: set,
+        wishes: set,
+        user_id: int,
+        user_filters: list = None,
+    ) -> list[dict[Any, Any]]:
         places = await self._repo.get_places_data(user_id)
         self._filter_bad_places(places)
 
@@ -297,14 +506,6 @@ class DbService:
                 if not added:  # ничего не добавили за полный проход → пора выходить
                     break
 
-        # --- Логирование распределения ---
-        dist = {}
-        for p in balanced_top:
-            dist[p["first_filter"]] = dist.get(p["first_filter"], 0) + 1
-        dist_str = ", ".join([f"{filt}: {count}" for filt, count in dist.items()])
-        logger.info(f"[get_all_places] Итоговое распределение фильтров: {dist_str}")
-
-        logger.info(f"[get_all_places] Отобрано топ-{len(balanced_top)} мест")
         return balanced_top
 
     @async_log_decorator(logger)
@@ -314,35 +515,29 @@ class DbService:
         сохраняя историю просмотров для оставшихся мест.
         """
         try:
-            # Сохраняем текущую историю просмотров
-            current_viewed_state = await self._repo.get_current_viewed_state_and_del(user_id)
-            # Получаем настройки пользователя
-            user = await self.get_user(user_id)
-            if not user:
-                return
-
-            categories = set(user["categories"])
-            wishes = set(user["wishes"])
-            user_filters = user["filters"]
-
-            # Получаем топ-400 мест (уже сбалансированные)
-            final_places = await self.get_all_places(
-                categories, wishes, user_id, user_filters, user["latitude"], user["longitude"]
-            )
-            logger.info(f"[create_user_places_table] Пользователь {user_id}: финально {len(final_places)} мест")
+            await self._interactions.flush(user_id)
+            # Удаление старых связей и запись новых — одной транзакцией на одном соединении
+            async with self.session(transaction=True):
+                # Сохраняем текущую историю просмотров
+                current_viewed_state = await self._repo.get_current_viewed_state_and_del(user_id)
+                # Получаем настройки пользователя
+                user = await self.get_user(user_id)
+                if not user:
+                    return
+
+                categories = set(user["categories"])
+                wishes = set(user["wishes"])
+                user_filters = user["filters"]
+
+                # Получаем топ-400 мест (уже сбалансированные)
+                final_places = await self.get_all_places(
+                    categories, wishes, user_id, user_filters, user["latitude"], user["longitude"]
+                )
+                logger.info(f"[create_user_places_table] Пользователь {user_id}: финально {len(final_places)} мест")
 
-            # Записываем в БД
-            for place in final_places:
-                viewed = current_viewed_state.get(place["name"], False)
-                try:
-                    await self._repo.save_user_places_relation(
-                        user_id,
-                        place["id"],
-                        viewed,
-                    )
-                except Exception as e:
-                    logger.error(f"[create_user_places_table] Ошибка вставки места {place.get('name')}: {e}")
-                    continue
+                # Записываем в БД одним пакетом
+                relations = [(place["id"], current_viewed_state.get(place["id"], False)) for place in final_places]
+                await self._repo.save_user_places_relations(user_id, relations)
 
             logger.info(f"[create_user_places_table] Пользователь {user_id}: таблица user_{user_id} успешно обновлена")
 
@@ -354,12 +549,11 @@ class DbService:
         user_id: int,
         limit: int = 400,
         offset: int = 0,
-        sort_by_distance: bool = False,
     ) -> list[dict[Any, Any]]:
         """
         Возвращает места для пользователя из его связи с местами.
         Если таблицы нет связей — наполняет таблицу.
-        sort_by_distance: если True, сортирует по расстоянию (если есть координаты пользователя).
+        Ближайшие места по всему каталогу отдаёт get_nearby_places_for_user.
         """
         # Получаем данные пользователя
 
@@ -368,10 +562,13 @@ class DbService:
         user_lat = user["latitude"] if user else None
         user_lon = user["longitude"] if user else None
 
-        if not await self._repo.user_places_relations_exists(user_id):
-            await self.create_user_places_relation(user_id)
+        await self._interactions.flush(user_id)
 
-        rows = await self._repo.get_user_places_data(user_id)
+        async with self.session():
+            if not await self._repo.user_places_relations_exists(user_id):
+                await self.create_user_places_relation(user_id)
+
+            rows = await self._repo.get_user_places_data(user_id)
 
         places = [
             {
@@ -380,6 +577,9 @@ class DbService:
                 "address": row["address"],
                 "description": row["description"],
                 "categories": row["categories"],
+                "categories_1": row["categories_1"],
+                "categories_2": row["categories_2"],
+                "website": row["website"],
                 "photo": row["photo"],
                 "rating": row["rating"],
                 "latitude": row["latitude"],
@@ -388,9 +588,11 @@ class DbService:
             for row in rows
         ]
 
-        # 🔹 Если нужна сортировка по расстоянию
-        if sort_by_distance and user_lat is not None and user_lon is not None:
-            places = self._sort_places_by_distance(places, user_lat, user_lon)
+        # 🔹 Считаем расстояния один раз на всю подборку
+        if user_lat is not None and user_lon is not None:
+            distances = self._distances_km(places, user_lat, user_lon)
+            for place, distance in zip(places, distances):
+                place["distance"] = None if np.isnan(distance) else float(distance)
 
         # 🔹 Применяем limit и offset
         if limit:
@@ -400,33 +602,88 @@ class DbService:
 
         return places
 
+    async def save_user_feed(self, user_id: int, places: list[dict[Any, Any]]) -> None:
+        """
+        Сохраняет подборку пользователя в Redis: id и расстояния отдельно, карточки мест общие.
+        """
+        await self._redis_service.set_user_feed(user_id, places, self._place_card_ttl)
+
+    async def get_feed_place(self, user_id: int, index: int) -> Optional[dict[Any, Any]]:
+        """
+        Карточка места из подборки пользователя по индексу вместе с расстоянием до него.
+        Если карточка вытеснена из кэша, она перечитывается из БД и кладётся обратно.
+        """
+        item = await self._redis_service.get_user_feed_item(user_id, index)
+        if item is None:
+            return None
+        place_id, distance = item
+        place = (await self._redis_service.get_place_cards([place_id])).get(place_id)
+        return await self._complete_feed_place(place_id, distance, place)
+
+    async def move_feed_cursor(self, user_id: int, step: int) -> tuple[str, int, Optional[dict[Any, Any]]]:
+        """
+        Атомарно листает подборку пользователя на step мест.
+        Возвращает (статус, индекс, карточка места); статус "ok" или признак начала/конца подборки.
+        """
+        status, index, item, place = await self._redis_service.move_feed_cursor(user_id, step)
+        if item is None:
+            return status, index, None
+        place_id, distance = item
+        return status, index, await self._complete_feed_place(place_id, distance, place)
+
+    async def _complete_feed_place(
+        self, place_id: int, distance: Optional[float], place: Optional[dict[Any, Any]]
+    ) -> Optional[dict[Any, Any]]:
+        if place is None:
+            rows = await self._repo.get_places_by_ids([place_id])
+            if not rows:
+                return None
+            place = dict(rows[0])
+            await self._redis_service.set_place_cards([place], self._place_card_ttl)
+
+        place["distance"] = distance
+        return place
+
     @async_log_decorator(logger)
-    async def mark_place_as_viewed(self, user_id: int, place_name: str) -> None:
+    async def mark_place_as_viewed(self, user_id: int, place_id: int) -> None:
         """
-        Помечает место как просмотренное по названию
+        Помечает место как просмотренное (запись в БД отложенная, см. flush_place_interactions)
         """
-        try:
-            await self._repo.mark_place_as_viewed(user_id, place_name)
-        except Exception as e:
-            logger.error(f"Error marking place as viewed: {e}")
+        self._interactions.add(user_id, place_id, viewed=True)
+
+    async def get_nearby_places_for_user(self, user_id: int, limit: int = 400) -> list[dict[Any, Any]]:
+        """
+        Ближайшие к пользователю места всего каталога (а не только его подборки).
+        Без геолокации возвращает подборку пользователя как есть.
+        """
+        user = await self.get_user(user_id)
+        if not user or user["latitude"] is None or user["longitude"] is None:
+            return await self.get_places_for_user(user_id, limit=limit)
+
+        await self._interactions.flush(user_id)
+
+        rows = await self._repo.get_nearby_places(
+            user_id,
+            user["latitude"],
+            user["longitude"],
+            self._nearby_radius_km * 1000,
+            list(Constants.BAD_PLACE_NAMES.value),
+            limit,
+        )
+        return [dict(row) for row in rows]
 
     @async_log_decorator(logger)
-    async def mark_place_as_liked(self, user_id: int, place_name: str, place_address: str) -> None:
-        try:
-            await self._repo.mark_place_as_liked(user_id, place_name, place_address)
-        except Exception as e:
-            logger.error(f"Error marking place as liked: {e}")
+    async def mark_place_as_liked(self, user_id: int, place_id: int) -> None:
+        self._interactions.add(user_id, place_id, favourite=True)
 
     @async_log_decorator(logger)
-    async def mark_place_as_disliked(self, user_id: int, place_name: str, place_address: str) -> None:
-        try:
-            await self._repo.mark_place_as_disliked(user_id, place_name, place_address)
-        except Exception as e:
-            logger.error(f"Error marking place as disliked: {e}")
+    async def mark_place_as_disliked(self, user_id: int, place_id: int) -> None:
+        self._interactions.add(user_id, place_id, favourite=False)
 
     @async_log_decorator(logger)
     async def get_liked_places(self, user_id: int):
         try:
+            await self._interactions.flush(user_id)
             return await self._repo.get_liked_places(user_id)
         except Exception as e:
             logger.error(f"Error getting liked places: {e}")
@@ -434,6 +691,7 @@ class DbService:
     @async_log_decorator(logger)
     async def get_disliked_places(self, user_id: int):
         try:
+            await self._interactions.flush(user_id)
             return await self._repo.get_disliked_places(user_id)
         except Exception as e:
             logger.error(f"Error getting disliked places: {e}")
@@ -441,6 +699,7 @@ class DbService:
     @async_log_decorator(logger)
     async def delete_liked_disliked(self, user_id: int, place_name: str):
         try:
+            await self._interactions.flush(user_id)
             return await self._repo.delete_liked_disliked(user_id, place_name)
         except Exception as e:
             logger.error(f"Error deleting place from liked or disliked: {e}")
@@ -462,50 +721,23 @@ class DbService:
         except Exception as e:
             logger.error(f"Ошибка при сбросе viewed: {e}")
 
-    def _sort_places_by_distance(
-        self, places: list[dict[Any, Any]], user_lat: float, user_lon: float
-    ) -> list[dict[Any, Any]]:
+    def _distances_km(self, places: list[dict[Any, Any]], user_lat: float, user_lon: float) -> np.ndarray:
         """
-        Сортирует места по расстоянию от пользователя
+        Расстояния от пользователя до мест в км (NaN, если координат нет).
+        Берёт заранее посчитанные радианы из каталога, иначе считает по координатам мест.
         """
+        if self._catalog is not None and self._catalog.loaded:
+            return self._catalog.distances_km([place["id"] for place in places], user_lat, user_lon)
 
-        def calculate_distance(lat1, lon1, lat2, lon2):
-            # Упрощенная формула расчета расстояния (в км)
-            from math import atan2, cos, radians, sin, sqrt
-
-            R = 6371  # Радиус Земли в км
-
-            lat1_rad = radians(lat1)
-            lon1_rad = radians(lon1)
-            lat2_rad = radians(lat2)
-            lon2_rad = radians(lon2)
-
-            dlon = lon2_rad - lon1_rad
-            dlat = lat2_rad - lat1_rad
-
-            a = sin(dlat / 2) ** 2 + cos(lat1_rad) * cos(lat2_rad) * sin(dlon / 2) ** 2
-            c = 2 * atan2(sqrt(a), sqrt(1 - a))
-
-            return R * c
-
-        # Фильтруем места с координатами и добавляем расстояние
-        places_with_distance = []
+        coords = []
         for place in places:
-            if place.get("latitude") and place.get("longitude"):
-                try:
-                    place_lat = float(place["latitude"])
-                    place_lon = float(place["longitude"])
-                    distance = calculate_distance(user_lat, user_lon, place_lat, place_lon)
-                    places_with_distance.append((place, distance))
-                except (ValueError, TypeError):
-                    # Если координаты некорректны, пропускаем место
-                    continue
-
-        # Сортируем по расстоянию
-        places_with_distance.sort(key=lambda x: x[1])
-
-        # Возвращаем только места, без расстояния
-        return [place for place, distance in places_with_distance]
+            try:
+                coords.append((float(place["latitude"]), float(place["longitude"])))
+            except (ValueError, TypeError):
+                # Если координаты некорректны, место не участвует в сортировке
+                coords.append((np.nan, np.nan))
+        coords = np.array(coords, dtype=np.float64).reshape(-1, 2)
+        return geo.haversine_km(user_lat, user_lon, *geo.to_radians(coords[:, 0], coords[:, 1]))
 
     async def show_active_today_users(self) -> str:
         rows = await self._repo.get_active_today_users()
@@ -527,9 +759,45 @@ class DbService:
             await self._repo.delete_user(user_id)
         except Exception as e:
             logger.error(f"Error while deleting user {user_id=}: {e}")
+            return
+
+        memo = self._profiles.get()
+        if memo is not None:
+            memo.pop(user_id, None)
+        if self._redis_service is not None:
+            try:
+                await self._redis_service.delete_user_profile(user_id)
+            except Exception as e:
+                logger.error(f"Error deleting cached profile {user_id=}: {e}")
+
+    async def delete_users(self, user_ids: list[int], chunk_size: int = 1000) -> None:
+        """
+        Удаляет пользователей пачками одним запросом на пачку. Ошибки БД пробрасываются вызывающему.
+        """
+        for start in range(0, len(user_ids), chunk_size):
+            chunk = user_ids[start : start + chunk_size]
+            await self._repo.delete_users(chunk)
+
+            memo = self._profiles.get()
+            if memo is not None:
+                for user_id in chunk:
+                    memo.pop(user_id, None)
+            if self._redis_service is not None:
+                try:
+                    await self._redis_service.delete_user_profiles(chunk)
+                except Exception as e:
+                    logger.error(f"Error deleting cached profiles: {e}")
 
     async def delete_place(self, place_id: int) -> None:
         await self._repo.delete_place(place_id)
+        if self._catalog is not None:
+            self._catalog.discard(place_id)
+        if self._redis_service is not None:
+            await self._redis_service.delete_place_card(place_id)
+
+    @staticmethod
+    def _tags_to_ids(tags, vocabulary: list[str]) -> list[int]:
+        return sorted({vocabulary.index(tag) for tag in tags if tag in vocabulary})
 
     def _filter_bad_places(self, rows: list[Record]) -> None:
         for i in range(len(rows) - 1, -1, -1):
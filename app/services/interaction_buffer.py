@@ -0,0 +1,67 @@
+import asyncio
+import logging
+from typing import Optional
+
+from app.repositories.db_repo import DbRepo
+
+logger = logging.getLogger(__name__)
+
+
+class InteractionBuffer:
+    """
+    Копит просмотры, лайки и дизлайки мест в памяти и применяет их к users_places одной пачкой:
+    по таймеру (flush из планировщика), когда накопилось max_events событий,
+    или для одного пользователя перед чтением его связей с местами.
+    """
+
+    def __init__(self, repo: DbRepo, max_events: int = 500) -> None:
+        self._repo = repo
+        self._max_events = max_events
+        # user_id -> place_id -> [viewed, favourite]; None означает «не менялось»
+        self._pending: dict[int, dict[int, list[Optional[bool]]]] = {}
+        self._events = 0
+        self._lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def add(self, user_id: int, place_id: int, viewed: Optional[bool] = None, favourite: Optional[bool] = None) -> None:
+        state = self._pending.setdefault(user_id, {}).setdefault(place_id, [None, None])
+        if viewed is not None:
+            state[0] = viewed
+        if favourite is not None:
+            state[1] = favourite
+        self._events += 1
+        if self._events >= self._max_events and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self.flush())
+
+    async def flush(self, user_id: Optional[int] = None) -> None:
+        """
+        Применяет накопленные события всех пользователей или только user_id.
+        """
+        async with self._lock:
+            if user_id is None:
+                pending, self._pending = self._pending, {}
+                self._events = 0
+            elif user_id in self._pending:
+                pending = {user_id: self._pending.pop(user_id)}
+            else:
+                return
+            if not pending:
+                return
+
+            interactions = [
+                (uid, place_id, viewed, favourite)
+                for uid, places in pending.items()
+                for place_id, (viewed, favourite) in places.items()
+            ]
+            try:
+                await self._repo.apply_user_places_interactions(interactions)
+                logger.info(f"[InteractionBuffer] Записано {len(interactions)} изменений связей с местами")
+            except Exception as e:
+                logger.error(f"Error flushing place interactions: {e}")
+                # Возвращаем события в буфер, более новые значения важнее
+                for uid, places in pending.items():
+                    current = self._pending.setdefault(uid, {})
+                    for place_id, (viewed, favourite) in places.items():
+                        state = current.setdefault(place_id, [None, None])
+                        state[0] = state[0] if state[0] is not None else viewed
+                        state[1] = state[1] if state[1] is not None else favourite
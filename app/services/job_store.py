@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import pickle
+from typing import Optional
+
+from apscheduler.job import Job
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.util import datetime_to_utc_timestamp
+
+from app.repositories.db_repo import DbRepo
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncpgJobStore(MemoryJobStore):
+    """
+    Хранилище задач APScheduler в Postgres через asyncpg. Интерфейс хранилища у APScheduler синхронный,
+    поэтому задачи живут в памяти (как в MemoryJobStore), а изменения записываются в apscheduler_jobs
+    фоновой задачей пачками, не блокируя цикл событий. Задачи из базы загружаются при старте планировщика.
+    """
+
+    def __init__(self, repo: DbRepo, pickle_protocol: int = pickle.HIGHEST_PROTOCOL) -> None:
+        super().__init__()
+        self._repo = repo
+        self._pickle_protocol = pickle_protocol
+        # id задачи -> (next_run_time, job_state) для записи или None для удаления
+        self._pending: dict[str, Optional[tuple[Optional[float], bytes]]] = {}
+        self._clear = False
+        self._lock = asyncio.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._load_task: Optional[asyncio.Task] = None
+
+    def start(self, scheduler, alias) -> None:
+        super().start(scheduler, alias)
+        self._loop = asyncio.get_running_loop()
+        self._load_task = self._loop.create_task(self._load_jobs())
+
+    async def wait_loaded(self) -> None:
+        if self._load_task is not None:
+            await self._load_task
+
+    async def _load_jobs(self) -> None:
+        try:
+            rows = await self._repo.get_scheduler_jobs()
+        except Exception as e:
+            logger.error(f"Error while loading scheduler jobs: {e}")
+            return
+
+        loaded = 0
+        for row in rows:
+            if row["id"] in self._jobs_index:
+                # Задача уже добавлена заново при запуске (replace_existing), её версия новее
+                continue
+            try:
+                job = self._reconstitute_job(row["job_state"])
+            except Exception as e:
+                logger.error(f"Unable to restore scheduler job {row['id']}: {e}")
+                continue
+            super().add_job(job)
+            loaded += 1
+        logger.info(f"[AsyncpgJobStore] Загружено {loaded} задач")
+        self._scheduler.wakeup()
+
+    def _reconstitute_job(self, job_state: bytes) -> Job:
+        state = pickle.loads(job_state)
+        state["jobstore"] = self
+        job = Job.__new__(Job)
+        job.__setstate__(state)
+        job._scheduler = self._scheduler
+        job._jobstore_alias = self._alias
+        return job
+
+    def add_job(self, job: Job) -> None:
+        super().add_job(job)
+        self._save(job)
+
+    def update_job(self, job: Job) -> None:
+        super().update_job(job)
+        self._save(job)
+
+    def remove_job(self, job_id: str) -> None:
+        super().remove_job(job_id)
+        self._pending[job_id] = None
+        self._schedule_flush()
+
+    def remove_all_jobs(self) -> None:
+        super().remove_all_jobs()
+        self._pending.clear()
+        self._clear = True
+        self._schedule_flush()
+
+    def shutdown(self) -> None:
+        # Остановка планировщика не должна удалять задачи из базы, как это делает MemoryJobStore
+        super().remove_all_jobs()
+
+    def _save(self, job: Job) -> None:
+        job_state = pickle.dumps(job.__getstate__(), self._pickle_protocol)
+        self._pending[job.id] = (datetime_to_utc_timestamp(job.next_run_time), job_state)
+        self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        if self._loop is None:
+            return
+        # Задачи могут меняться и из потоков исполнителя, запись всегда запускается в цикле событий
+        self._loop.call_soon_threadsafe(self._start_flush)
+
+    def _start_flush(self) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = self._loop.create_task(self.flush())
+
+    async def flush(self) -> None:
+        """
+        Записывает в базу все накопленные изменения задач.
+        """
+        async with self._lock:
+            while self._pending or self._clear:
+                pending, self._pending = self._pending, {}
+                clear, self._clear = self._clear, False
+                upserts = [(job_id, *change) for job_id, change in pending.items() if change is not None]
+                deletes = [job_id for job_id, change in pending.items() if change is None]
+                try:
+                    await self._repo.save_scheduler_jobs(upserts, deletes, clear)
+                except Exception as e:
+                    logger.error(f"Error while saving scheduler jobs: {e}")
+                    # Возвращаем изменения, более новые важнее; запишутся при следующем изменении или остановке
+                    if not self._clear:
+                        for job_id, change in pending.items():
+                            self._pending.setdefault(job_id, change)
+                    self._clear = self._clear or clear
+                    return
@@ -0,0 +1,207 @@
+import logging
+from typing import Any, Optional
+
+import numpy as np
+
+from app.bot.constants import Constants
+from app.bot.msgs_text import AVAILABLE_FILTERS
+from app.core import geo
+from app.repositories.db_repo import DbRepo
+
+logger = logging.getLogger(__name__)
+
+_FILTER_WORDS = (len(AVAILABLE_FILTERS) + 63) // 64
+
+
+def _bits(ids: Optional[list[int]], words: int = 1) -> np.ndarray:
+    res = np.zeros(words, dtype=np.uint64)
+    for i in ids or []:
+        res[i // 64] |= np.uint64(1) << np.uint64(i % 64)
+    return res
+
+
+class PlaceCatalog:
+    """
+    Колоночная копия таблицы places в памяти процесса для ранжирования без запросов к БД.
+    Места отсортированы по id, поэтому индекс в массивах совпадает с порядком id.
+    """
+
+    def __init__(self, repo: DbRepo) -> None:
+        self._repo = repo
+        self.version: Optional[int] = None
+        self.ids = np.empty(0, dtype=np.int64)
+        self.names: list[str] = []
+        self.latitude = np.empty(0, dtype=np.float64)
+        self.longitude = np.empty(0, dtype=np.float64)
+        self.rating = np.empty(0, dtype=np.float64)
+        self.lat_rad, self.lon_rad, self.cos_lat = geo.to_radians(self.latitude, self.longitude)
+        self.first_filter_code = np.empty(0, dtype=np.int32)
+        self.first_filters: list[str] = []
+        self.filter_bits = np.empty((0, _FILTER_WORDS), dtype=np.uint64)
+        self.category_bits = np.empty(0, dtype=np.uint64)
+        self.wish_bits = np.empty(0, dtype=np.uint64)
+
+    @property
+    def loaded(self) -> bool:
+        return self.version is not None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    async def load(self) -> None:
+        version = await self._repo.get_catalog_version()
+        rows = await self._repo.get_catalog_places()
+        bad_names = Constants.BAD_PLACE_NAMES.value
+        rows = [r for r in rows if not any(bad in (r["name"] or "").lower() for bad in bad_names)]
+
+        n = len(rows)
+        codes: dict[str, int] = {}
+        first_filter_code = np.empty(n, dtype=np.int32)
+        filter_bits = np.zeros((n, _FILTER_WORDS), dtype=np.uint64)
+        category_bits = np.zeros(n, dtype=np.uint64)
+        wish_bits = np.zeros(n, dtype=np.uint64)
+        for i, r in enumerate(rows):
+            first_filter_code[i] = codes.setdefault(r["first_filter"] or "other", len(codes))
+            filter_bits[i] = _bits(r["filter_ids"], _FILTER_WORDS)
+            category_bits[i] = _bits(r["category_ids"])[0]
+            wish_bits[i] = _bits(r["wish_ids"])[0]
+
+        # Присваиваем всё разом, без await между присваиваниями
+        self.ids = np.fromiter((r["id"] for r in rows), dtype=np.int64, count=n)
+        self.names = [r["name"] for r in rows]
+        self.latitude = np.array([r["latitude"] for r in rows], dtype=np.float64)
+        self.longitude = np.array([r["longitude"] for r in rows], dtype=np.float64)
+        self.rating = np.array([r["rating"] for r in rows], dtype=np.float64)
+        self.lat_rad, self.lon_rad, self.cos_lat = geo.to_radians(self.latitude, self.longitude)
+        self.first_filter_code = first_filter_code
+        self.first_filters = list(codes)
+        self.filter_bits = filter_bits
+        self.category_bits = category_bits
+        self.wish_bits = wish_bits
+        self.version = version
+        logger.info(f"[PlaceCatalog] Загружено {n} мест, версия каталога {version}")
+
+    async def refresh(self) -> bool:
+        """
+        Перечитывает каталог, если версия в БД изменилась.
+        """
+        version = await self._repo.get_catalog_version()
+        if version == self.version:
+            return False
+        await self.load()
+        return True
+
+    def discard(self, place_id: int) -> None:
+        idx = np.searchsorted(self.ids, place_id)
+        if idx < len(self.ids) and self.ids[idx] == place_id:
+            keep = np.ones(len(self.ids), dtype=bool)
+            keep[idx] = False
+            self.ids = self.ids[keep]
+            self.names = [name for i, name in enumerate(self.names) if i != idx]
+            self.latitude = self.latitude[keep]
+            self.longitude = self.longitude[keep]
+            self.rating = self.rating[keep]
+            self.lat_rad = self.lat_rad[keep]
+            self.lon_rad = self.lon_rad[keep]
+            self.cos_lat = self.cos_lat[keep]
+            self.first_filter_code = self.first_filter_code[keep]
+            self.filter_bits = self.filter_bits[keep]
+            self.category_bits = self.category_bits[keep]
+            self.wish_bits = self.wish_bits[keep]
+
+    def distances_km(self, place_ids: list[int], user_lat: float, user_lon: float) -> np.ndarray:
+        """
+        Расстояния до мест в порядке place_ids по заранее посчитанным радианам. Для неизвестных мест — NaN.
+        """
+        place_ids = np.asarray(place_ids, dtype=np.int64)
+        res = np.full(len(place_ids), np.nan)
+        if not len(self.ids):
+            return res
+        pos = np.searchsorted(self.ids, place_ids).clip(max=len(self.ids) - 1)
+        found = self.ids[pos] == place_ids
+        pos = pos[found]
+        res[found] = geo.haversine_km(user_lat, user_lon, self.lat_rad[pos], self.lon_rad[pos], self.cos_lat[pos])
+        return res
+
+    def rank(
+        self,
+        category_ids: list[int],
+        wish_ids: list[int],
+        user_filters: list[str],
+        filter_ids: list[int],
+        excluded_ids: Optional[list[int]] = None,
+        limit: int = 400,
+    ) -> list[dict[Any, Any]]:
+        """
+        Та же логика, что и в DbRepo.get_ranked_places: очки 300/100/50, отбор по фильтрам
+        и поочерёдная выдача по первому фильтру места.
+        Без фильтров и с одним фильтром результат совпадает с DbService._rank_places_python.
+        При нескольких фильтрах прежний расчёт брал место группы случайно из 10 лучших (randrange),
+        а здесь берётся лучшее, при равных очках — с меньшим id: состав подборки и чередование групп
+        те же, порядок мест внутри группы другой (см. tests/test_place_catalog.py).
+        """
+        mask = np.ones(len(self.ids), dtype=bool)
+        if excluded_ids:
+            mask &= ~np.isin(self.ids, np.asarray(excluded_ids, dtype=np.int64))
+        if user_filters:
+            # Неизвестные фильтры дают пустой filter_ids, и тогда подходящих мест нет
+            mask &= ((self.filter_bits & _bits(filter_ids, _FILTER_WORDS)) != 0).any(axis=1)
+
+        codes = {name: code for code, name in enumerate(self.first_filters)}
+        user_codes = [codes[f] for f in user_filters if f in codes]
+
+        idx = np.flatnonzero(mask)
+        first = self.first_filter_code[idx]
+        score = (
+            300 * np.isin(first, user_codes).astype(np.int64)
+            + 100 * np.bitwise_count(self.category_bits[idx] & _bits(category_ids)[0]).astype(np.int64)
+            + 50 * np.bitwise_count(self.wish_bits[idx] & _bits(wish_ids)[0]).astype(np.int64)
+        )
+
+        # Уникальный ключ: очки по убыванию, затем id по возрастанию
+        key = -score * (len(self.ids) + 1) + idx
+
+        if len(user_filters) == 1:
+            if len(key) > limit:
+                top = np.argpartition(key, limit)[:limit]
+                order = top[np.argsort(key[top])]
+            else:
+                order = np.argsort(key)
+        else:
+            order = np.argsort(key)
+            groups = first[order]
+            # Номер места внутри своей группы первого фильтра
+            by_group = np.argsort(groups, kind="stable")
+            sorted_groups = groups[by_group]
+            starts = np.r_[0, np.flatnonzero(np.diff(sorted_groups)) + 1]
+            counts = np.diff(np.r_[starts, len(sorted_groups)])
+            within = np.empty(len(groups), dtype=np.int64)
+            within[by_group] = np.arange(len(groups)) - np.repeat(starts, counts)
+
+            if not user_filters:
+                # Группы чередуются в порядке появления их лучшего места
+                group_order = np.zeros(len(self.first_filters), dtype=np.int64)
+                group_order[groups[within == 0]] = np.flatnonzero(within == 0)
+                secondary = group_order[groups]
+                keep = np.ones(len(groups), dtype=bool)
+            else:
+                # Группы чередуются в порядке фильтров пользователя
+                positions = np.full(len(self.first_filters), -1, dtype=np.int64)
+                for pos, code in enumerate(user_codes):
+                    if positions[code] < 0:
+                        positions[code] = pos
+                secondary = positions[groups]
+                keep = secondary >= 0
+
+            balanced = np.flatnonzero(keep)[np.lexsort((secondary[keep], within[keep]))]
+            order = order[balanced[:limit]]
+
+        return [
+            {
+                "id": int(self.ids[idx[i]]),
+                "name": self.names[idx[i]],
+                "total_score": int(score[i]),
+                "first_filter": self.first_filters[first[i]],
+            }
+            for i in order[:limit]
+        ]
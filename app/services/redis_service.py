@@ -9,6 +9,19 @@ from app.repositories.redis_repo import RedisRepo
 
 logger = logging.getLogger(__name__)
 
+# Результаты сдвига по подборке, когда места для показа нет
+FEED_START = "start"
+FEED_END = "end"
+FEED_EMPTY = "empty"
+
+# Отметка о том, что сессии из прежних ключей data:{user_id} перенесены (см. migrate_legacy_sessions)
+LEGACY_SESSIONS_MIGRATED = "migrations:legacy_sessions"
+
+# Итог отправки сообщения рассылки одному получателю
+BROADCAST_SENT = "sent"
+BROADCAST_BLOCKED = "blocked"
+BROADCAST_FAILED = "failed"
+
 
 class RedisService:
     def __init__(self, repo: RedisRepo) -> None:
@@ -17,15 +30,31 @@ class RedisService:
     async def close_redis(self):
         await self._repo.close()
 
-    async def set_user_msg(self, chat_id: int, msg_id: int) -> None:
-        await self._repo.set(f"msg:{chat_id}", msg_id)
+    async def ping(self) -> None:
+        await self._repo.ping()
+
+    async def set_user_msg(self, chat_id: int, msg_id: int, has_media: bool = False) -> None:
+        await self._repo.set(f"msg:{chat_id}", f"{msg_id}:{int(has_media)}")
 
     async def get_user_msg(self, chat_id: int) -> Optional[int]:
-        return await self._repo.get(f"msg:{chat_id}")
+        return (await self.get_user_msg_info(chat_id))[0]
+
+    async def get_user_msg_info(self, chat_id: int) -> tuple[Optional[int], bool]:
+        """
+        Id последнего сообщения бота в чате и есть ли в нём фото или анимация.
+        """
+        value = await self._repo.get(f"msg:{chat_id}")
+        if value is None:
+            return None, False
+        msg_id, _, has_media = value.partition(":")
+        return int(msg_id), has_media == "1"
 
     async def set_user_data(self, user_id: int, data: dict[Any, Any]) -> None:
+        """
+        Полностью заменяет сессию пользователя. Каждое поле хранится отдельно в хэше session:{user_id}.
+        """
         logger.info(f"Setting data for {user_id=}")
-        await self._repo.set(f"data:{user_id}", json.dumps(data))
+        await self._repo.replace_hash(f"session:{user_id}", {k: json.dumps(v) for k, v in data.items()})
 
     async def set_user_liked_disliked(self, user_id: int, data: list[Record], liked: bool = True) -> None:
         logger.info(f"Setting liked for {user_id=}")
@@ -49,18 +78,200 @@ class RedisService:
         key = f"liked:{user_id}" if liked else f"disliked:{user_id}"
         return len(await self._repo.get_list(key, 0, -1))
 
-    async def get_user_data(self, user_id: int) -> dict[Any, Any]:
-        data = await self._repo.get(f"data:{user_id}")
-        return json.loads(data) if data is not None else {}
+    async def get_user_data(self, user_id: int, *fields: str) -> dict[Any, Any]:
+        """
+        Возвращает сессию пользователя целиком или только указанные поля (отсутствующие поля не попадают в ответ).
+        """
+        key = f"session:{user_id}"
+        if fields:
+            values = await self._repo.get_hash_fields(key, list(fields))
+            data = {k: v for k, v in zip(fields, values) if v is not None}
+        else:
+            data = await self._repo.get_hash(key)
+        return {k: json.loads(v) for k, v in data.items()}
 
     async def set_user_data_params(self, user_id: int, params: dict[Any, Any]) -> None:
-        data = await self.get_user_data(user_id)
-        for k, v in params.items():
-            data[k] = v
-        await self.set_user_data(user_id, data)
+        await self._repo.set_hash_fields(f"session:{user_id}", {k: json.dumps(v) for k, v in params.items()})
+
+    async def user_data_exists(self, user_id: int) -> bool:
+        return await self._repo.exists(f"session:{user_id}")
+
+    async def migrate_legacy_sessions(self, card_ttl: int) -> int:
+        """
+        Однократно переносит сессии из прежних JSON-ключей data:{user_id} в хэши session:{user_id},
+        а сохранённые в них места — в подборку feed:{user_id}. Перенесённые ключи удаляются.
+        Уже существующие новые сессии не перезаписываются. Возвращает число перенесённых сессий.
+        """
+        if await self._repo.exists(LEGACY_SESSIONS_MIGRATED):
+            return 0
+        migrated = 0
+        failed = False
+        async for key in self._repo.scan_keys("data:*"):
+            try:
+                user_id = int(key.split(":", 1)[1])
+                value = await self._repo.get(key)
+                if value is not None and not await self.user_data_exists(user_id):
+                    data = json.loads(value)
+                    places = data.pop("places", None) or []
+                    await self._repo.replace_hash(f"session:{user_id}", {k: json.dumps(v) for k, v in data.items()})
+                    if places:
+                        await self.set_user_feed(user_id, places, card_ttl)
+                    migrated += 1
+                await self._repo.delete_key(key)
+            except Exception as e:
+                failed = True
+                logger.error(f"Error while migrating legacy session {key}: {e}")
+        if not failed:
+            await self._repo.set(LEGACY_SESSIONS_MIGRATED, 1)
+        return migrated
+
+    async def set_user_feed(self, user_id: int, places: list[dict[Any, Any]], card_ttl: int) -> None:
+        """
+        Сохраняет подборку пользователя как список [id, расстояние] в feed:{user_id},
+        а сами карточки мест — один раз на все подборки в общих ключах place:{id}.
+        Записываются только отсутствующие или истёкшие карточки.
+        """
+        feed = [json.dumps([place["id"], place.get("distance")]) for place in places]
+        cards = {
+            f"place:{place['id']}": json.dumps({k: v for k, v in place.items() if k != "distance"}) for place in places
+        }
+        await self._repo.set_list_with_values(f"feed:{user_id}", feed, cards, card_ttl)
+
+    async def get_user_feed_item(self, user_id: int, index: int) -> Optional[tuple[int, Optional[float]]]:
+        """
+        Возвращает (id места, расстояние) из подборки пользователя по индексу.
+        """
+        if index < 0:
+            return None
+        item = await self._repo.get_list_item(f"feed:{user_id}", index)
+        if item is None:
+            return None
+        place_id, distance = json.loads(item)
+        return place_id, distance
+
+    async def move_feed_cursor(
+        self, user_id: int, step: int
+    ) -> tuple[str, int, Optional[tuple[int, Optional[float]]], Optional[dict[Any, Any]]]:
+        """
+        Одним атомарным вызовом сдвигает current_place_index на step и возвращает
+        (статус, индекс, (id места, расстояние), карточка). Статус "ok" или FEED_START/FEED_END/FEED_EMPTY.
+        Карточка равна None, если она вытеснена из кэша.
+        """
+        status, index, item, card = await self._repo.move_list_cursor(
+            f"session:{user_id}", f"feed:{user_id}", "current_place_index", step, "place:"
+        )
+        if item is None:
+            return status, index, None, None
+        place_id, distance = json.loads(item)
+        return status, index, (place_id, distance), json.loads(card) if card is not None else None
+
+    async def get_place_cards(self, place_ids: list[int]) -> dict[int, dict[Any, Any]]:
+        values = await self._repo.get_many([f"place:{place_id}" for place_id in place_ids])
+        return {place_id: json.loads(v) for place_id, v in zip(place_ids, values) if v is not None}
+
+    async def set_place_cards(self, places: list[dict[Any, Any]], card_ttl: int) -> None:
+        await self._repo.set_many({f"place:{place['id']}": json.dumps(place) for place in places}, card_ttl)
+
+    async def delete_place_card(self, place_id: int) -> None:
+        await self._repo.delete_key(f"place:{place_id}")
+
+    async def get_user_profile(self, user_id: int) -> Optional[dict[Any, Any]]:
+        data = await self._repo.get(f"profile:{user_id}")
+        return json.loads(data) if data is not None else None
+
+    async def set_user_profile(self, user_id: int, profile: dict[Any, Any], ttl: int) -> None:
+        await self._repo.set(f"profile:{user_id}", json.dumps(profile), ex=ttl)
+
+    async def delete_user_profile(self, user_id: int) -> None:
+        await self._repo.delete_key(f"profile:{user_id}")
+
+    async def delete_user_profiles(self, user_ids: list[int]) -> None:
+        await self._repo.delete_keys(*[f"profile:{user_id}" for user_id in user_ids])
+
+    async def get_media_file_id(self, media_key: str) -> Optional[str]:
+        return (await self._repo.get_hash_fields("media:file_ids", [media_key]))[0]
+
+    async def set_media_file_id(self, media_key: str, file_id: str) -> None:
+        await self._repo.set_hash_fields("media:file_ids", {media_key: file_id})
+
+    async def delete_media_file_id(self, media_key: str) -> None:
+        await self._repo.delete_hash_field("media:file_ids", media_key)
+
+    async def create_broadcast(self, broadcast_id: str, data: dict[str, Any]) -> None:
+        """
+        Сохраняет параметры рассылки и помечает её как незавершённую.
+        """
+        await self._repo.replace_hash(f"broadcast:{broadcast_id}", {k: json.dumps(v) for k, v in data.items()})
+        await self._repo.add_to_set("broadcasts:active", broadcast_id)
+
+    async def get_active_broadcasts(self) -> list[str]:
+        return sorted(await self._repo.get_set_members("broadcasts:active"))
+
+    async def get_broadcast(self, broadcast_id: str) -> dict[str, Any]:
+        data = await self._repo.get_hash(f"broadcast:{broadcast_id}")
+        return {k: json.loads(v) for k, v in data.items()}
+
+    async def set_broadcast_params(self, broadcast_id: str, params: dict[str, Any]) -> None:
+        await self._repo.set_hash_fields(f"broadcast:{broadcast_id}", {k: json.dumps(v) for k, v in params.items()})
+
+    async def get_broadcast_done(self, broadcast_id: str) -> set[int]:
+        """
+        Получатели после сохранённого курсора, которым рассылка уже отправлялась (с любым итогом).
+        """
+        return {int(user_id) for user_id in await self._repo.get_zset_members(f"broadcast:{broadcast_id}:done")}
+
+    async def get_broadcast_blocked(self, broadcast_id: str) -> list[int]:
+        return [int(user_id) for user_id in await self._repo.get_set_members(f"broadcast:{broadcast_id}:blocked")]
+
+    async def record_broadcast_result(self, broadcast_id: str, user_id: int, result: str) -> None:
+        await self._repo.add_scored_and_incr(
+            f"broadcast:{broadcast_id}:done",
+            user_id,
+            user_id,
+            f"broadcast:{broadcast_id}",
+            result,
+            set_key=f"broadcast:{broadcast_id}:blocked" if result == BROADCAST_BLOCKED else None,
+        )
+
+    async def save_broadcast_cursor(self, broadcast_id: str, cursor: int) -> None:
+        """
+        Запоминает, что всем получателям с id не больше cursor рассылка уже отправлялась.
+        """
+        await self._repo.set_hash_fields_and_trim_zset(
+            f"broadcast:{broadcast_id}", {"cursor": json.dumps(cursor)}, f"broadcast:{broadcast_id}:done", cursor
+        )
+
+    async def finish_broadcast(self, broadcast_id: str) -> None:
+        await self._repo.remove_from_set("broadcasts:active", broadcast_id)
+        await self._repo.delete_keys(
+            f"broadcast:{broadcast_id}",
+            f"broadcast:{broadcast_id}:done",
+            f"broadcast:{broadcast_id}:blocked",
+        )
+
+    async def schedule_msg_deletion(self, chat_id: int, msg_id: int, delete_at: float) -> None:
+        """
+        Ставит сообщение в очередь отложенного удаления; delete_at — unix-время удаления.
+        """
+        await self._repo.add_scored("msg_deletions", {f"{chat_id}:{msg_id}": delete_at})
+
+    async def pop_due_msg_deletions(self, now: float, limit: int) -> list[tuple[int, int]]:
+        """
+        Забирает из очереди до limit сообщений, время удаления которых наступило: [(chat_id, msg_id), ...].
+        """
+        items = await self._repo.pop_by_score("msg_deletions", now, limit)
+        res = []
+        for item in items:
+            chat_id, _, msg_id = item.partition(":")
+            res.append((int(chat_id), int(msg_id)))
+        return res
+
+    async def get_ranking(self, key: str) -> Optional[list[Any]]:
+        data = await self._repo.get_and_touch(f"ranking:{key}", "ranking:lru")
+        return json.loads(data) if data is not None else None
 
-    async def get_keys(self, pattern="*") -> list[Any]:
-        return await self._repo.get_keys(pattern)
+    async def set_ranking(self, key: str, ranking: list[Any], ttl: int, max_keys: int) -> None:
+        await self._repo.set_with_lru(f"ranking:{key}", json.dumps(ranking), ttl, "ranking:lru", max_keys)
 
     @sync_log_decorator(logger)
     async def get_daily_count(self) -> int:
@@ -0,0 +1,118 @@
+import asyncio
+import random
+
+import pytest
+
+from app.bot.msgs_text import AVAILABLE_FILTERS, MsgsText
+from app.services.db_service import DbService
+from app.services.place_catalog import PlaceCatalog
+
+CATEGORIES = MsgsText.CATEGORIES_TYPES.value
+WISHES = MsgsText.WISHES_TYPES.value
+# Часть фильтров, чтобы в группах первого фильтра было по нескольку мест
+FILTERS = AVAILABLE_FILTERS[:8]
+
+
+def _tag_ids(tags_str: str, vocabulary: list[str]) -> list[int]:
+    # То же, что SQL-функция place_tag_ids
+    return sorted({vocabulary.index(t.strip()) for t in tags_str.split(",") if t.strip() in vocabulary})
+
+
+def _first_filter(tags_str: str) -> str:
+    # То же, что SQL-функция place_first_filter
+    return next((t.strip() for t in tags_str.split(",") if t.strip()), "other")
+
+
+def _make_places(seed: int, count: int = 300) -> list[dict]:
+    rnd = random.Random(seed)
+    places = []
+    for place_id in range(1, count + 1):
+        places.append(
+            {
+                "id": place_id,
+                "name": f"Место {place_id}",
+                "address": f"Адрес {place_id}",
+                "description": "",
+                "categories_ya": ", ".join(rnd.sample(FILTERS, rnd.randint(0, 3))),
+                "categories_1": ",".join(rnd.sample(CATEGORIES, rnd.randint(0, 3))),
+                "categories_2": ",".join(rnd.sample(WISHES, rnd.randint(0, 3))),
+                "photo": None,
+                "rating": rnd.uniform(3, 5),
+                "latitude": rnd.uniform(55, 56),
+                "longitude": rnd.uniform(37, 38),
+            }
+        )
+    return places
+
+
+class _FakeRepo:
+    def __init__(self, places: list[dict]) -> None:
+        self._places = places
+
+    async def get_catalog_version(self) -> int:
+        return 1
+
+    async def get_catalog_places(self) -> list[dict]:
+        return [
+            {
+                "id": p["id"],
+                "name": p["name"],
+                "latitude": p["latitude"],
+                "longitude": p["longitude"],
+                "rating": p["rating"],
+                "first_filter": _first_filter(p["categories_ya"]),
+                "filter_ids": _tag_ids(p["categories_ya"], AVAILABLE_FILTERS),
+                "category_ids": _tag_ids(p["categories_1"], CATEGORIES),
+                "wish_ids": _tag_ids(p["categories_2"], WISHES),
+            }
+            for p in self._places
+        ]
+
+    async def get_places_data(self, user_id: int) -> list[dict]:
+        return [dict(p) for p in self._places]
+
+
+def _rank_both(seed: int, categories: list[str], wishes: list[str], user_filters: list[str]):
+    repo = _FakeRepo(_make_places(seed))
+    catalog = PlaceCatalog(repo)
+    service = DbService(repo, ranking="python", catalog=catalog)
+
+    async def run():
+        await catalog.load()
+        random.seed(seed)
+        python_top = await service._rank_places_python(set(categories), set(wishes), 1, user_filters)
+        catalog_top = catalog.rank(
+            DbService._tags_to_ids(categories, CATEGORIES),
+            DbService._tags_to_ids(wishes, WISHES),
+            user_filters,
+            DbService._tags_to_ids(user_filters, AVAILABLE_FILTERS),
+        )
+        return python_top, catalog_top
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+@pytest.mark.parametrize("user_filters", [[], [FILTERS[0]]])
+def test_rank_matches_python_exactly_with_at_most_one_filter(seed, user_filters):
+    python_top, catalog_top = _rank_both(seed, CATEGORIES[:2], WISHES[:1], user_filters)
+
+    assert [p["id"] for p in catalog_top] == [p["id"] for p in python_top]
+    assert [p["total_score"] for p in catalog_top] == [p["total_score"] for p in python_top]
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_rank_matches_python_up_to_tie_break_with_several_filters(seed):
+    # Прежний расчёт берёт место группы случайно из 10 лучших (randrange), каталог — всегда лучшее,
+    # поэтому совпадают состав подборки и порядок чередования групп, но не порядок мест внутри группы
+    user_filters = [FILTERS[2], FILTERS[0], FILTERS[5]]
+    python_top, catalog_top = _rank_both(seed, CATEGORIES[:1], WISHES[:2], user_filters)
+
+    assert sorted(p["id"] for p in catalog_top) == sorted(p["id"] for p in python_top)
+    assert [p["first_filter"] for p in catalog_top] == [p["first_filter"] for p in python_top]
+
+    scores = {p["id"]: p["total_score"] for p in python_top}
+    assert all(p["total_score"] == scores[p["id"]] for p in catalog_top)
+    for group in user_filters:
+        ranked = [p["total_score"] for p in catalog_top if p["first_filter"] == group]
+        assert ranked == sorted(ranked, reverse=True)
@@ -0,0 +1,86 @@
+import asyncio
+
+from aiogram import Bot, Dispatcher
+from aiohttp.test_utils import TestClient, TestServer
+
+from app.bot.webhook import SECRET_HEADER, WebhookServer
+
+SECRET = "secret-token"
+
+
+def _update(update_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": 1,
+            "date": 1700000000,
+            "chat": {"id": 42, "type": "private"},
+            "from": {"id": 42, "is_bot": False, "first_name": "Test"},
+            "text": "/start",
+        },
+    }
+
+
+def _run(server: WebhookServer, scenario) -> None:
+    async def run():
+        # Обработчики не запускаются, поэтому принятые обновления остаются в очереди
+        async with TestClient(TestServer(server._make_app())) as client:
+            await scenario(client)
+
+    asyncio.run(run())
+
+
+def _make_server(**kwargs) -> WebhookServer:
+    return WebhookServer(Bot("123456:TEST"), Dispatcher(), SECRET, **kwargs)
+
+
+def test_rejects_wrong_or_missing_secret():
+    server = _make_server()
+
+    async def scenario(client):
+        resp = await client.post("/webhook", json=_update(1), headers={SECRET_HEADER: "wrong"})
+        assert resp.status == 403
+        resp = await client.post("/webhook", json=_update(2))
+        assert resp.status == 403
+        assert server._queue.empty()
+
+    _run(server, scenario)
+
+
+def test_returns_503_when_queue_is_full():
+    server = _make_server(queue_size=2)
+
+    async def scenario(client):
+        for update_id in (1, 2):
+            resp = await client.post("/webhook", json=_update(update_id), headers={SECRET_HEADER: SECRET})
+            assert resp.status == 200
+        resp = await client.post("/webhook", json=_update(3), headers={SECRET_HEADER: SECRET})
+        assert resp.status == 503
+        assert server._queue.qsize() == 2
+
+    _run(server, scenario)
+
+
+def test_readyz_reports_state_and_failed_checks():
+    async def failing_check():
+        raise ConnectionError("db is down")
+
+    server = _make_server(readiness_checks=[failing_check])
+
+    async def scenario(client):
+        resp = await client.get("/readyz")
+        assert resp.status == 503
+        assert await resp.text() == "starting"
+
+        server._ready = True
+        resp = await client.get("/readyz")
+        assert resp.status == 503
+        assert await resp.text() == "db is down"
+
+        server._readiness_checks = []
+        resp = await client.get("/readyz")
+        assert resp.status == 200
+        resp = await client.get("/healthz")
+        assert resp.status == 200
+
+    _run(server, scenario)